@@ -0,0 +1,99 @@
+"""
+Checks the cold import time of the graph modules against a budget.
+
+Each module is imported in a fresh interpreter with `python -X importtime`.
+The check fails if the cumulative import time exceeds the budget, or if a
+module that should only load on first use (provider SDKs, the vector store,
+tree-sitter grammars) was imported anyway.
+
+Usage:
+    python benchmarks/import_budget.py --budget-ms 1500
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+MODULES = ["agent.supervisor_graph_demo", "agent.hierarchy_graph_demo"]
+
+# only imported once the LLM, the index or the embeddings are first used
+DEFERRED_MODULES = [
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_deepseek",
+    "langchain_community.cache",
+    "agent.llm_cache",
+    "langchain_chroma",
+    "chromadb",
+    "tree_sitter_python",
+    "tree_sitter_java",
+]
+
+
+def parse_importtime(stderr):
+    """Maps each imported module to its (self, cumulative) import time in microseconds."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure_import(module, python=sys.executable):
+    """Imports `module` in a fresh interpreter and returns its `-X importtime` timings."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    # no bytecode writes, so the first and later runs measure the same thing
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def check_module(module, budget_ms):
+    """Returns the import time of `module` in ms and the list of budget violations."""
+    timings = measure_import(module)
+    total_ms = timings[module][1] / 1000
+    violations = []
+    if total_ms > budget_ms:
+        violations.append(f"{module} took {total_ms:.0f}ms (budget {budget_ms:.0f}ms)")
+    for deferred in DEFERRED_MODULES:
+        if deferred in timings:
+            violations.append(f"{module} eagerly imports {deferred}")
+    return total_ms, violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("IMPORT_BUDGET_MS", "1500")),
+        help="maximum cumulative import time per module (env IMPORT_BUDGET_MS)",
+    )
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        total_ms, violations = check_module(module, args.budget_ms)
+        print(f"{module}: {total_ms:.0f}ms")
+        for violation in violations:
+            print(f"  [E] {violation}")
+        failed = failed or bool(violations)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
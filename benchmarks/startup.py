@@ -0,0 +1,258 @@
+"""
+Import-time and cold-start benchmarks of the agent modules and graphs.
+
+Records, each in a fresh interpreter:
+- the `python -X importtime` breakdown of every `agent.*` module
+- the time-to-first-node of every graph in `langgraph.json`, i.e. the time from
+  process start until the first graph node finished, with `LLM_PROVIDER=fake`
+- the peak RSS of each of these processes
+
+Results are stored as JSON (by default under `benchmarks/results/`, named after
+the current commit) so regressions can be compared across commits.
+
+Usage:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --baseline benchmarks/results/startup-<commit>.json
+"""
+
+import time
+
+PROCESS_START = time.perf_counter()
+
+import argparse
+import json
+import os
+import pkgutil
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+
+from import_budget import SRC_DIR, measure_import
+
+ROOT_DIR = os.path.dirname(SRC_DIR)
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# Input the first node (`input_handler`) rejects without touching GitHub
+DEFAULT_INPUT = "benchmark: no issue"
+
+
+def peak_rss_kb():
+    """Peak resident set size of the current process in KB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB on Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")]))
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env.setdefault("LANGSMITH_TRACING", "false")
+    # offline LLM routing straight to FINISH, see `agent.fake_models`
+    env["LLM_PROVIDER"] = "fake"
+    env.pop("FAKE_LLM_SCRIPT", None)
+    env.pop("LLM_REPLAY_PATH", None)
+    return env
+
+
+def agent_modules():
+    """Names of all modules of the `agent` package."""
+    sys.path.insert(0, SRC_DIR)
+    import agent
+
+    return ["agent"] + sorted(
+        info.name
+        for info in pkgutil.walk_packages(agent.__path__, prefix="agent.")
+        if not info.name.endswith("__main__")
+    )
+
+
+def langgraph_graphs():
+    """Maps the graph names of `langgraph.json` to their (module, attribute)."""
+    with open(os.path.join(ROOT_DIR, "langgraph.json"), encoding="utf-8") as f:
+        graphs = json.load(f)["graphs"]
+    result = {}
+    for name, spec in graphs.items():
+        path, attr = spec.rsplit(":", 1)
+        module = os.path.relpath(os.path.join(ROOT_DIR, path), SRC_DIR)
+        result[name] = (module[: -len(".py")].replace(os.sep, "."), attr)
+    return result
+
+
+def run_first_node(graph_name, user_input):
+    """Runs `graph_name` until its first node finished, in the current process.
+
+    Returns:
+        result (dict): Timings in seconds since the process started and the peak RSS."""
+    import asyncio
+    import importlib
+
+    module_name, attr = langgraph_graphs()[graph_name]
+
+    start = time.perf_counter()
+    graph = getattr(importlib.import_module(module_name), attr)
+    imported = time.perf_counter()
+
+    from langchain_core.messages import HumanMessage
+
+    async def first_node():
+        first_start = None
+        async for event in graph.astream_events(
+            {
+                "messages": [HumanMessage(content=user_input)],
+                "preset": user_input,
+                "human_in_the_loop": False,
+            },
+            config={"configurable": {"thread_id": "startup-benchmark"}},
+            version="v2",
+        ):
+            node = event.get("metadata", {}).get("langgraph_node")
+            if node is None or event["name"] != node:
+                continue
+            if event["event"] == "on_chain_start" and first_start is None:
+                first_start = (node, time.perf_counter())
+            elif event["event"] == "on_chain_end" and node == first_start[0]:
+                return first_start, time.perf_counter()
+        raise RuntimeError(f"{graph_name} finished without running a node")
+
+    (node, node_start), node_end = asyncio.run(first_node())
+    return {
+        "graph": graph_name,
+        "first_node": node,
+        "setup": round(start - PROCESS_START, 4),
+        "import": round(imported - start, 4),
+        "first_node_start": round(node_start - PROCESS_START, 4),
+        "first_node_end": round(node_end - PROCESS_START, 4),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def measure_first_node(graph_name, user_input):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", graph_name, "--input", user_input],
+        env=child_env(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Running {graph_name} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_module(module, top=10):
+    """Cold import time of `module` with its `top` most expensive imports, in ms."""
+    timings = measure_import(module)
+    heaviest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "cumulative_ms": timings[module][1] / 1000,
+        "self_ms": timings[module][0] / 1000,
+        "modules": len(timings),
+        "heaviest_self_ms": {name: t[0] / 1000 for name, t in heaviest},
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(repeat, user_input, modules=None):
+    results = {
+        "commit": current_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "imports": {},
+        "graphs": {},
+    }
+    for module in modules or agent_modules():
+        runs = [measure_module(module) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run["cumulative_ms"])
+        best["median_cumulative_ms"] = statistics.median(r["cumulative_ms"] for r in runs)
+        results["imports"][module] = best
+        print(f"import {module}: {best['median_cumulative_ms']:.0f}ms")
+
+    for graph_name in langgraph_graphs():
+        runs = [measure_first_node(graph_name, user_input) for _ in range(repeat)]
+        summary = {
+            key: statistics.median(run[key] for run in runs)
+            for key in ("import", "first_node_start", "first_node_end", "peak_rss_kb")
+        }
+        summary["first_node"] = runs[0]["first_node"]
+        summary["runs"] = runs
+        results["graphs"][graph_name] = summary
+        print(
+            f"graph {graph_name}: first node {summary['first_node']!r} done after "
+            f"{summary['first_node_end']:.2f}s, peak RSS {summary['peak_rss_kb'] / 1024:.0f}MB"
+        )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Lists the measurements that got more than `threshold` (relative) worse than `baseline`."""
+    regressions = []
+
+    def check(label, new, old):
+        if old and new > old * (1 + threshold):
+            regressions.append(f"{label}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+
+    for module, new in results["imports"].items():
+        old = baseline["imports"].get(module)
+        if old:
+            check(f"import {module} [ms]", new["median_cumulative_ms"], old["median_cumulative_ms"])
+    for graph_name, new in results["graphs"].items():
+        old = baseline["graphs"].get(graph_name)
+        if old:
+            check(f"{graph_name} first node [s]", new["first_node_end"], old["first_node_end"])
+            check(f"{graph_name} peak RSS [KB]", new["peak_rss_kb"], old["peak_rss_kb"])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="JSON result file, defaults to results/startup-<commit>.json")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per measurement")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as regression")
+    parser.add_argument(
+        "--input",
+        default=DEFAULT_INPUT,
+        help="first user message; an issue URL makes the first node set up the repository",
+    )
+    parser.add_argument("--modules", nargs="*", help="only measure these modules")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_first_node(args.child, args.input)))
+        return 0
+
+    results = run_benchmarks(args.repeat, args.input, args.modules)
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"[E] regression {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
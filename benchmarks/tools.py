@@ -0,0 +1,350 @@
+"""
+Latency and memory benchmarks of the agent tools on synthetic repositories.
+
+Generates git repositories of configurable size (number of files, directory
+depth, file length, languages) and times the hot tool paths on each of them:
+`view_directory`, `view_file_content`, `OHEditor.str_replace`/`insert`,
+`DefaultLinter.lint_file_diff`, `create_project_knowledge` (with the local
+`HashedNgramEmbeddings`) and `extract_git_diff_local`.
+
+Every operation reports p50/p95 latency over `--repeat` runs and its peak
+Python allocation (`tracemalloc`, measured on an extra run) and the results are
+stored as JSON, so scaling can be tracked as repositories grow.
+
+Usage:
+    python benchmarks/tools.py --sizes 1000 10000
+    python benchmarks/tools.py --sizes 200000 --skip create_project_knowledge
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from import_budget import SRC_DIR
+from startup import RESULTS_DIR, current_commit, peak_rss_kb
+
+sys.path.insert(0, SRC_DIR)
+# offline models, so indexing runs without an embedding API
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ["EMBEDDING_PROVIDER"] = "hash"
+
+OPERATIONS = [
+    "view_directory",
+    "view_file_content",
+    "str_replace",
+    "insert",
+    "lint_file_diff",
+    "create_project_knowledge",
+    "extract_git_diff_local",
+]
+
+PY_TEMPLATE = '''"""Synthetic module {index}."""
+
+import os
+
+
+class Model{index}:
+    def __init__(self, value):
+        self.value = value
+
+{functions}
+'''
+
+PY_FUNCTION = '''    def compute_{index}_{n}(self, items):
+        """Combines the items with the model value."""
+        total = self.value
+        for item in items:
+            total += len(str(item)) * {n}
+        return os.path.join(str(total), "{index}")
+
+'''
+
+JAVA_TEMPLATE = """package synthetic;
+
+public class Model{index} {{
+    private int value;
+
+    public Model{index}(int value) {{
+        this.value = value;
+    }}
+
+{methods}}}
+"""
+
+JAVA_METHOD = """    public int compute{n}(int[] items) {{
+        int total = this.value;
+        for (int item : items) {{
+            total += item * {n};
+        }}
+        return total;
+    }}
+
+"""
+
+
+def file_content(language, index, lines):
+    """Source of synthetic file `index`, about `lines` lines long."""
+    if language == "java":
+        methods = "".join(JAVA_METHOD.format(n=n) for n in range(max(1, lines // 8)))
+        return JAVA_TEMPLATE.format(index=index, methods=methods)
+    functions = "".join(
+        PY_FUNCTION.format(index=index, n=n) for n in range(max(1, lines // 7))
+    )
+    return PY_TEMPLATE.format(index=index, functions=functions)
+
+
+def generate_repo(path, files, depth=4, lines=100, languages=("py",), seed=0):
+    """Creates a committed git repository of `files` synthetic source files at `path`.
+
+    Files are spread over a directory tree `depth` levels deep with up to 10
+    subdirectories per level. An existing repository at `path` is reused.
+
+    Returns:
+        file_paths (list): Paths of the generated files relative to `path`."""
+    rng = random.Random(seed)
+    file_paths = []
+    for index in range(files):
+        language = languages[index % len(languages)]
+        dirs = [f"pkg{rng.randrange(10)}" for _ in range(rng.randint(1, depth))]
+        name = f"Model{index}.java" if language == "java" else f"module_{index}.py"
+        file_paths.append(os.path.join(*dirs, name))
+    if os.path.isdir(os.path.join(path, ".git")):
+        return file_paths
+
+    print(f"Generating {files} files in {path}")
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    for index, file_path in enumerate(file_paths):
+        full_path = os.path.join(tmp_path, file_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        language = "java" if file_path.endswith(".java") else "py"
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(file_content(language, index, lines))
+
+    def git(*args):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    git("init", "-q")
+    git("add", "-A")
+    git("-c", "user.name=bench", "-c", "user.email=bench@localhost", "commit", "-q", "-m", "synthetic")
+    os.rename(tmp_path, path)
+    return file_paths
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the progress output of the tools while they are timed."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def measure(fn, repeat, setup=None):
+    """Times `fn` over `repeat` runs, then traces the allocations of one more run.
+
+    Args:
+        fn (Callable): The operation
+        repeat (int): Number of timed runs
+        setup (Callable, optional): Untimed preparation before every run
+    Returns:
+        result (dict): p50/p95/mean latency in ms and peak traced memory in KB."""
+    latencies = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with quiet():
+            start = time.perf_counter()
+            fn()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        with quiet():
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "runs": repeat,
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_repo(repo_path, file_paths, repeat, skip=()):
+    """Runs every operation of `OPERATIONS` not in `skip` against `repo_path`."""
+    from agent.runtime_config import RuntimeConfig, RuntimeType
+    from agent.tool_set.context_tools import create_project_knowledge
+    from agent.tool_set.linter import DefaultLinter
+    from agent.tool_set.oheditor import OHEditor
+    from agent.tool_set.sepl_tools import (
+        extract_git_diff_local,
+        view_directory,
+        view_file_content,
+    )
+
+    thread_id = "tools-benchmark-" + os.path.basename(repo_path)
+    config = {"configurable": {"thread_id": thread_id, "proj_path": repo_path}}
+    rc = RuntimeConfig.from_config(config)
+    rc.proj_name = "synthetic/" + os.path.basename(repo_path)
+    rc.proj_path = repo_path
+    rc.runtime_dir = os.path.dirname(repo_path)
+    rc.initialized = True
+    rc.runtime_type = RuntimeType.LOCAL
+
+    rng = random.Random(1)
+    sample = [rng.choice(file_paths) for _ in range(repeat)]
+    py_files = [p for p in file_paths if p.endswith(".py")] or file_paths
+    target = os.path.join(repo_path, py_files[0])
+    with open(target, encoding="utf-8") as f:
+        original = f.read()
+
+    def restore():
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(original)
+
+    editor = OHEditor()
+    target_path = Path(target)
+    linter = DefaultLinter()
+    samples = iter(sample * 2)
+    results = {}
+
+    def run(name, fn, setup=None, runs=repeat):
+        if name in skip:
+            return
+        results[name] = measure(fn, runs, setup)
+        print(f"  {name}: p50 {results[name]['p50_ms']:.1f}ms p95 {results[name]['p95_ms']:.1f}ms")
+
+    run("view_directory", lambda: view_directory.invoke({"dir_path": "./"}, config=config))
+    run(
+        "view_file_content",
+        lambda: view_file_content.invoke({"file_name": next(samples)}, config=config),
+    )
+    run(
+        "str_replace",
+        lambda: editor.str_replace(target_path, "self.value = value", "self.value = value  # set", False),
+        setup=restore,
+    )
+    run(
+        "insert",
+        lambda: editor.insert(target_path, 3, "import sys", False),
+        setup=restore,
+    )
+
+    updated = target + ".updated"
+
+    def write_updated():
+        restore()
+        with open(updated, "w", encoding="utf-8") as f:
+            f.write(original.replace("total = self.value", "total = self.value + undefined_name", 1))
+
+    run("lint_file_diff", lambda: linter.lint_file_diff(target, updated), setup=write_updated)
+    if os.path.exists(updated):
+        os.remove(updated)
+    restore()
+
+    # chroma keeps clients of opened paths alive, so every build gets a new collection
+    builds = iter(range(repeat + 1))
+    collections = []
+
+    def build_index():
+        collections.append(f"bench_{next(builds)}")
+        create_project_knowledge(repo_path, collection_name=collections[-1])
+
+    try:
+        # indexing is slow, time a single build
+        run("create_project_knowledge", build_index, runs=1)
+    finally:
+        for collection in collections:
+            shutil.rmtree(
+                os.path.join(
+                    rc.runtime_dir,
+                    f"{collection}_{os.path.basename(repo_path)}_hash",
+                ),
+                ignore_errors=True,
+            )
+
+    def modify_files():
+        for file_path in file_paths[:10]:
+            with open(os.path.join(repo_path, file_path), "a", encoding="utf-8") as f:
+                f.write("\n# changed\n")
+
+    try:
+        run("extract_git_diff_local", lambda: extract_git_diff_local(config=config), setup=modify_files)
+    finally:
+        subprocess.run(["git", "checkout", "--", "."], cwd=repo_path, check=True, capture_output=True)
+        RuntimeConfig.discard(thread_id)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="number of files per repository")
+    parser.add_argument("--depth", type=int, default=4, help="maximum directory depth")
+    parser.add_argument("--lines", type=int, default=100, help="approximate lines per file")
+    parser.add_argument("--languages", nargs="+", default=["py", "java"], choices=["py", "java"])
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="timed runs per operation")
+    parser.add_argument("--skip", nargs="*", default=[], choices=OPERATIONS, help="operations to leave out")
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(RESULTS_DIR, "repos"),
+        help="where synthetic repositories are generated, reused across runs",
+    )
+    parser.add_argument("-o", "--output", help="JSON result file, defaults to results/tools-<commit>.json")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": current_commit(),
+        "timestamp": time.time(),
+        "params": {
+            "depth": args.depth,
+            "lines": args.lines,
+            "languages": args.languages,
+            "repeat": args.repeat,
+        },
+        "repos": {},
+    }
+    for size in args.sizes:
+        name = f"synthetic-{size}-d{args.depth}-l{args.lines}-{'-'.join(args.languages)}"
+        repo_path = os.path.join(os.path.abspath(args.work_dir), name)
+        start = time.perf_counter()
+        file_paths = generate_repo(
+            repo_path, size, depth=args.depth, lines=args.lines, languages=args.languages
+        )
+        print(f"{name} ({time.perf_counter() - start:.1f}s to prepare)")
+        operations = bench_repo(repo_path, file_paths, args.repeat, skip=args.skip)
+        results["repos"][name] = {
+            "files": size,
+            "operations": operations,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"tools-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Concurrent batch driver running the issue resolving graphs over many issues.
+
+Reads a JSONL file with one issue per line, e.g.
+
+    {"instance_id": "GitPython-1413", "issue_url": "https://github.com/gitpython-developers/GitPython/issues/1413"}
+
+and runs the selected graph on up to `--concurrency` issues at once, with
+separate bounds per LLM provider and per repository. Every finished issue is
+appended to the output JSONL together with its patch and timings, so a crashed
+batch resumes where it stopped when started again with the same output file.
+Issues that were running when the batch stopped continue from their last
+checkpoint (the instance id is the LangGraph `thread_id`), see `checkpointer.py`.
+
+Usage:
+    python -m agent.batch issues.jsonl -o results.jsonl -n 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+
+from langchain_core.messages import HumanMessage
+
+from agent.checkpointer import flush_checkpoints, get_checkpointer, resume_runtime
+from agent.constant import METRICS_PROMETHEUS_PATH
+from agent.github_utils import github_request_metrics, parse_github_issue_url, prefetch_issues
+from agent.llm import llm_cache_metrics, prompt_cache_metrics
+from agent.metrics import install_metrics, write_prometheus
+from agent.run_logging import setup_logging
+from agent.runtime_config import RuntimeConfig
+from agent.tool_set.sepl_tools import aextract_git_diff_local
+
+GRAPHS = {
+    "supervisor": ("agent.supervisor_graph_demo", "issue_resolve_graph"),
+    "hierarchy": ("agent.hierarchy_graph_demo", "hierarchy_graph"),
+}
+
+
+def load_graph(name, checkpointer=None):
+    """Import the compiled graph registered under `name` in `GRAPHS`, using `checkpointer` if given."""
+    import importlib
+
+    module_name, attr = GRAPHS[name]
+    graph = getattr(importlib.import_module(module_name), attr)
+    if checkpointer is not None:
+        # subgraphs compiled without one use the parent's
+        graph = graph.copy(update={"checkpointer": checkpointer})
+    return graph
+
+
+def instance_id_of(record):
+    """The identifier of an issue record, derived from its URL when not given."""
+    if record.get("instance_id"):
+        return str(record["instance_id"])
+    owner, project, issue = parse_github_issue_url(record["issue_url"])
+    if not owner:
+        raise ValueError(f"Invalid GitHub issue URL passed in: {record['issue_url']}")
+    return f"{owner}+{project}-{issue}"
+
+
+def read_issues(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_finished(path, retry_errors=False):
+    """Instance ids already recorded in the output file of a previous batch run."""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # last line of a crashed run may be truncated
+                continue
+            if retry_errors and result.get("status") != "ok":
+                continue
+            finished.add(result["instance_id"])
+    return finished
+
+
+class BatchLimits:
+    """Bounds the number of concurrent runs overall, per LLM provider and per repository."""
+
+    def __init__(self, concurrency, per_provider, per_repo):
+        self.total = asyncio.Semaphore(concurrency)
+        self.providers = defaultdict(lambda: asyncio.Semaphore(per_provider))
+        self.repos = defaultdict(lambda: asyncio.Semaphore(per_repo))
+
+    def slots(self, provider, repo):
+        return self.total, self.providers[provider], self.repos[repo]
+
+
+class BatchRunner:
+    """Runs a graph over a list of issue records and appends results to a JSONL file."""
+
+    def __init__(
+        self,
+        graph_name="supervisor",
+        output_path="results.jsonl",
+        concurrency=4,
+        per_provider=4,
+        per_repo=2,
+        recursion_limit=100,
+        prefetch_workers=8,
+        prometheus_path=None,
+    ):
+        self.graph_name = graph_name
+        self.graph = load_graph(graph_name, get_checkpointer())
+        self.output_path = output_path
+        self.limits = BatchLimits(concurrency, per_provider, per_repo)
+        self.recursion_limit = recursion_limit
+        self.prefetch_workers = prefetch_workers
+        self.prometheus_path = prometheus_path
+        self._write_lock = asyncio.Lock()
+
+    async def write_result(self, result):
+        async with self._write_lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def run_issue(self, record):
+        instance_id = instance_id_of(record)
+        issue_url = record["issue_url"]
+        owner, project, _ = parse_github_issue_url(issue_url)
+        provider = record.get("provider") or os.getenv("LLM_PROVIDER", "default")
+        config = {
+            "recursion_limit": self.recursion_limit,
+            # the worktree holds the patch read after the run, discarded below
+            "configurable": {"thread_id": instance_id, "keep_runtime": True},
+        }
+        initial_input = {
+            "messages": [HumanMessage(content=issue_url)],
+            "preset": issue_url,
+            "human_in_the_loop": False,
+        }
+
+        result = {
+            "instance_id": instance_id,
+            "issue_url": issue_url,
+            "graph": self.graph_name,
+        }
+        total, provider_slot, repo_slot = self.limits.slots(
+            provider, f"{owner}/{project}"
+        )
+        # narrowest bound first so waiting runs don't hold a global slot
+        async with repo_slot, provider_slot, total:
+            start = last = time.perf_counter()
+            node_timings = []
+            try:
+                graph_input = initial_input
+                snapshot = (
+                    await self.graph.aget_state(config) if self.graph.checkpointer else None
+                )
+                if snapshot and snapshot.values:
+                    # checkpointed by an earlier batch, continue from its last step
+                    print(f"[batch] resuming {instance_id} at step {snapshot.metadata.get('step')}")
+                    await asyncio.to_thread(resume_runtime, snapshot.values, config)
+                    graph_input = None
+                    result["resumed"] = True
+                else:
+                    print(f"[batch] starting {instance_id}")
+                # a finished snapshot has no next node, streaming it is a no-op
+                async for update in self.graph.astream(
+                    graph_input, config=config, stream_mode="updates"
+                ):
+                    now = time.perf_counter()
+                    for node in update:
+                        node_timings.append([node, round(now - last, 3)])
+                    last = now
+                result["patch"] = await aextract_git_diff_local(config=config)
+                result["status"] = "ok"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = repr(e)
+            finally:
+                result["wall_time"] = round(time.perf_counter() - start, 3)
+                result["node_timings"] = node_timings
+                RuntimeConfig.discard(instance_id)
+                metrics = install_metrics()
+                if metrics:
+                    result["metrics"] = metrics.run_summary(instance_id)
+                    metrics.discard(instance_id)
+            if self.graph.checkpointer:
+                if result["status"] == "ok":
+                    # recorded in the output, the checkpoints are not needed anymore
+                    await self.graph.checkpointer.adelete_thread(instance_id)
+                await asyncio.to_thread(flush_checkpoints)
+
+        await self.write_result(result)
+        print(
+            f"[batch] {instance_id}: {result['status']} in {result['wall_time']:.1f}s"
+        )
+        return result
+
+    async def run(self, records, retry_errors=False):
+        finished = read_finished(self.output_path, retry_errors=retry_errors)
+        pending = [r for r in records if instance_id_of(r) not in finished]
+        print(
+            f"[batch] {len(records)} issues, {len(records) - len(pending)} already done, {len(pending)} to run"
+        )
+        if self.prefetch_workers and pending:
+            # resolve issue metadata up front so graph startup never waits on GitHub
+            errors = await asyncio.to_thread(
+                prefetch_issues,
+                [r["issue_url"] for r in pending],
+                max_workers=self.prefetch_workers,
+            )
+            for issue_url, error in errors.items():
+                print(f"[batch] prefetch failed for {issue_url}: {error}")
+        results = await asyncio.gather(*(self.run_issue(r) for r in pending))
+        for model, metrics in llm_cache_metrics().items():
+            print(
+                f"[batch] LLM cache {model}: {metrics['hits']} hits, {metrics['misses']} misses ({metrics['hit_rate']:.0%})"
+            )
+        github = github_request_metrics()
+        print(
+            f"[batch] GitHub API: {github['requests']} requests, {github['retries']} retries, {github['connection_errors']} connection errors, waited {github['wait_time']:.1f}s (max {github['max_wait']:.1f}s)"
+        )
+        for model, usage in prompt_cache_metrics().items():
+            print(
+                f"[batch] Prompt cache {model}: {usage['cache_read']} of {usage['input_tokens']} input tokens cached ({usage['cached_share']:.0%}) over {usage['calls']} calls"
+            )
+        metrics = install_metrics()
+        if metrics:
+            totals = metrics.totals()
+            for kind in ("nodes", "llm", "tools"):
+                for name, entry in sorted(totals[kind].items(), key=lambda e: -e[1]["seconds"]):
+                    print(
+                        f"[batch] {kind} {name}: {entry['calls']} calls, {entry['seconds']:.1f}s, {entry['errors']} errors"
+                    )
+            if self.prometheus_path:
+                write_prometheus(self.prometheus_path)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("issues", help="JSONL file with one `issue_url` per line")
+    parser.add_argument("-o", "--output", default="results.jsonl")
+    parser.add_argument("-g", "--graph", choices=sorted(GRAPHS), default="supervisor")
+    parser.add_argument("-n", "--concurrency", type=int, default=4)
+    parser.add_argument("--per-provider", type=int, default=4)
+    parser.add_argument("--per-repo", type=int, default=2)
+    parser.add_argument("--recursion-limit", type=int, default=100)
+    parser.add_argument(
+        "--prefetch-workers",
+        type=int,
+        default=8,
+        help="concurrent GitHub fetches resolving all issues before the runs start, 0 to disable",
+    )
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help="rerun issues recorded with an error in the output file",
+    )
+    parser.add_argument(
+        "--prometheus",
+        default=METRICS_PROMETHEUS_PATH,
+        help="write the batch metrics to this file in the Prometheus text format",
+    )
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    runner = BatchRunner(
+        graph_name=args.graph,
+        output_path=args.output,
+        concurrency=args.concurrency,
+        per_provider=args.per_provider,
+        per_repo=args.per_repo,
+        recursion_limit=args.recursion_limit,
+        prefetch_workers=args.prefetch_workers,
+        prometheus_path=args.prometheus,
+    )
+    asyncio.run(runner.run(read_issues(args.issues), retry_errors=args.retry_errors))
+
+
+if __name__ == "__main__":
+    main()
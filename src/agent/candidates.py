@@ -0,0 +1,261 @@
+"""
+Multi-candidate patch generation for the problem_solver.
+
+With `PATCH_CANDIDATES` > 1, `solve_with_candidates` runs that many
+problem_solver agents concurrently, each in its own worktree leased from the
+`WORKTREE_POOL` and with its own sampling temperature. The candidates start
+from the run's current code changes. Their diffs are collected, identical
+patches deduplicated, and every distinct patch is reviewed in its worktree by a
+reviewer agent, concurrently, and scored. The best candidate's patch is applied
+to the run's worktree and the candidate worktrees go back to the pool.
+"""
+
+import functools
+import hashlib
+import logging
+import subprocess
+from dataclasses import dataclass, field
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables.config import get_executor_for_config
+from langgraph.prebuilt import create_react_agent
+from typing_extensions import TypedDict
+
+from agent.constant import CANDIDATE_TEMPERATURES
+from agent.llm import get_llm
+from agent.prompt import (
+    ISSUE_RESOLVE_CANDIDATE_REVIEW_PROMPT,
+    ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT,
+)
+from agent.prompt_caching import bind_agent_tools, cached_state_modifier, prompt_messages
+from agent.routing import LATEST_PATCH_PREFIX
+from agent.repo_cache import WORKTREE_POOL
+from agent.runtime_config import RuntimeConfig, RuntimeType
+from agent.tool_node import ConcurrentToolNode
+from agent.tool_set.context_tools import search_relevant_files
+from agent.tool_set.sepl_tools import (
+    extract_git_diff_local,
+    run_shell_cmd,
+    view_directory,
+    view_file_content,
+)
+
+logger = logging.getLogger(__name__)
+
+candidate_reviewer_tools = [
+    view_directory,
+    search_relevant_files,
+    view_file_content,
+    run_shell_cmd,
+]
+
+
+class CandidateReview(TypedDict):
+    """Score of a candidate patch."""
+
+    score: int
+    reason: str
+
+
+@dataclass
+class PatchCandidate:
+    index: int
+    temperature: float
+    run_id: str
+    messages: list = field(default_factory=list)
+    patch: str = ""
+    score: int = -1
+    reason: str = ""
+    duplicate_of: int = None
+
+
+def candidate_temperatures(k):
+    """Sampling temperatures of `k` candidates, `CANDIDATE_TEMPERATURES` or spread over 0-0.9."""
+    if CANDIDATE_TEMPERATURES:
+        return [CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)] for i in range(k)]
+    return [round(0.9 * i / max(1, k - 1), 2) for i in range(k)]
+
+
+def with_temperature(llm, temperature):
+    """Copy of `llm` sampling at `temperature`, `llm` itself if it has no temperature."""
+    if "temperature" not in type(llm).model_fields:
+        return llm
+    return llm.model_copy(update={"temperature": temperature})
+
+
+def patch_digest(patch):
+    """Digest of a patch ignoring blob hashes and trailing whitespace, to find identical candidates."""
+    lines = [
+        line.rstrip()
+        for line in patch.strip().splitlines()
+        if not line.startswith("index ")
+    ]
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def apply_patch(proj_path, patch):
+    if patch.strip():
+        subprocess.run(
+            ["git", "apply", "--whitespace=nowarn"],
+            cwd=proj_path,
+            input=patch if patch.endswith("\n") else patch + "\n",
+            text=True,
+            check=True,
+            capture_output=True,
+        )
+
+
+def _candidate_config(config, run_id):
+    # Its own thread_id gives the candidate its own runtime and checkpoints. The
+    # callbacks, tags and metadata of the calling node are still inherited through
+    # the context, so its LLM and tool calls are accounted to and traced under the run.
+    return {
+        "configurable": {"thread_id": run_id},
+        "recursion_limit": config.get("recursion_limit", 25),
+    }
+
+
+def _setup_candidate_runtime(rc, run_id, base_patch):
+    """Runtime of a candidate, checked out at the run's commit with `base_patch` applied."""
+    crc = RuntimeConfig.from_config({"configurable": {"thread_id": run_id}})
+    crc.proj_name = rc.proj_name
+    crc.issue_desc = rc.issue_desc
+    crc.commit_head = rc.commit_head
+    crc.runtime_type = RuntimeType.LOCAL
+    crc.proj_path = WORKTREE_POOL.acquire(run_id, rc.proj_name, rc.commit_head)
+    crc.initialized = True
+    crc.runtime_setup()
+    apply_patch(crc.proj_path, base_patch)
+    return crc
+
+
+@functools.cache
+def get_candidate_reviewer_agent():
+    # built on first run so importing the graph doesn't create the LLM
+    return create_react_agent(
+        bind_agent_tools(get_llm(), candidate_reviewer_tools, "reviewer"),
+        tools=ConcurrentToolNode(candidate_reviewer_tools),
+        state_modifier=cached_state_modifier(ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT, "reviewer"),
+    )
+
+
+def _generate(candidate, state, config, make_agent, rc, base_patch):
+    _setup_candidate_runtime(rc, candidate.run_id, base_patch)
+    candidate_config = _candidate_config(config, candidate.run_id)
+    result = make_agent(candidate.temperature).invoke(state, candidate_config)
+    candidate.messages = result["messages"][len(state["messages"]) :]
+    for msg in candidate.messages:
+        if isinstance(msg, AIMessage):
+            msg.name = "problem_solver"
+    candidate.patch = extract_git_diff_local(config=candidate_config)
+    return candidate
+
+
+def _review(candidate, state, config):
+    candidate_config = _candidate_config(config, candidate.run_id)
+    messages = (
+        state["messages"]
+        + candidate.messages
+        + [AIMessage(content=LATEST_PATCH_PREFIX + candidate.patch, name="problem_solver")]
+    )
+    result = get_candidate_reviewer_agent().invoke({**state, "messages": messages}, candidate_config)
+    review = result["messages"][len(messages) :] or result["messages"][-1:]
+    scored = (
+        get_llm()
+        .with_structured_output(CandidateReview)
+        .invoke(
+            prompt_messages(
+                ISSUE_RESOLVE_CANDIDATE_REVIEW_PROMPT,
+                [
+                    HumanMessage(content=LATEST_PATCH_PREFIX + candidate.patch),
+                    HumanMessage(content=f"Review:\n{review[-1].content}"),
+                ],
+            )
+        )
+    )
+    candidate.score = int(scored.get("score") or 0)
+    candidate.reason = scored.get("reason") or ""
+    return candidate
+
+
+def solve_with_candidates(state, config, make_agent, k):
+    """Runs `k` problem_solver candidates concurrently and keeps the best reviewed patch.
+
+    Args:
+        state (dict): The graph state
+        config (RunnableConfig): Config of the run
+        make_agent (Callable[[float], Runnable]): Returns the problem_solver agent sampling at a temperature
+        k (int): Number of candidates
+    Returns:
+        best (PatchCandidate): The selected candidate, whose patch is applied to the run's worktree
+        candidates (list): All candidates, in order"""
+    rc = RuntimeConfig.from_config(config)
+    base_patch = extract_git_diff_local(config=config)
+    candidates = [
+        PatchCandidate(index, temperature, f"{rc.run_id}-candidate-{index}")
+        for index, temperature in enumerate(candidate_temperatures(k))
+    ]
+    try:
+        with get_executor_for_config({**config, "max_concurrency": k}) as executor:
+            futures = [
+                executor.submit(_generate, c, state, config, make_agent, rc, base_patch)
+                for c in candidates
+            ]
+            for candidate, future in zip(candidates, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Candidate %d failed: %s", candidate.index, e)
+
+            unique = {}
+            for candidate in candidates:
+                if not candidate.patch.strip():
+                    continue
+                digest = patch_digest(candidate.patch)
+                if digest in unique:
+                    candidate.duplicate_of = unique[digest].index
+                else:
+                    unique[digest] = candidate
+            logger.info("%d distinct patches from %d candidates", len(unique), k)
+
+            futures = {
+                candidate.index: executor.submit(_review, candidate, state, config)
+                for candidate in unique.values()
+            }
+            for index, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Review of candidate %d failed: %s", index, e)
+
+        for candidate in candidates:
+            if candidate.duplicate_of is not None:
+                original = candidates[candidate.duplicate_of]
+                candidate.score, candidate.reason = original.score, original.reason
+
+        best = max(candidates, key=lambda c: (c.score, bool(c.patch.strip()), -c.index))
+        if best.patch.strip():
+            # files the solver created are untracked, reset alone would keep them
+            subprocess.run(["git", "reset", "--hard", "-q"], cwd=rc.proj_path, check=True)
+            subprocess.run(["git", "clean", "-fdq"], cwd=rc.proj_path, check=True)
+            apply_patch(rc.proj_path, best.patch)
+        return best, candidates
+    finally:
+        for candidate in candidates:
+            RuntimeConfig.discard(candidate.run_id)
+
+
+def selection_summary(best, candidates):
+    """Message content reporting the candidates and the selected one."""
+    lines = [
+        f"Selected candidate {best.index} of {len(candidates)} (temperature {best.temperature}, score {best.score}/10). {best.reason}".rstrip()
+    ]
+    for candidate in candidates:
+        if candidate.duplicate_of is not None:
+            outcome = f"same patch as candidate {candidate.duplicate_of}"
+        elif not candidate.patch.strip():
+            outcome = "no patch"
+        else:
+            outcome = f"score {candidate.score}/10. {candidate.reason}".rstrip()
+        lines.append(f"- Candidate {candidate.index} (temperature {candidate.temperature}): {outcome}")
+    return "\n".join(lines)
@@ -0,0 +1,241 @@
+"""
+Durable checkpoints of the graphs, created by `get_checkpointer`.
+
+The batch driver and the `__main__` demos run the graphs with the checkpointer
+configured by the `CHECKPOINT_*` env vars, so a run interrupted by a crash or a
+restart continues from its last finished step when started again with the same
+`thread_id`, instead of repeating the LLM work. The graph modules compile the
+graphs without one: the LangGraph server provides its own persistence, and the
+supervisor graph embedded in the hierarchy graph uses its parent's.
+
+`BatchedSqliteSaver` keeps the checkpoints in a SQLite file in WAL mode:
+- Writes are committed in batches, at most `CHECKPOINT_FLUSH_SECONDS` apart,
+  so quick steps (routing, handoffs) don't pay one fsync each. Slow steps, such
+  as the LLM calls of an agent, are committed as soon as they finish.
+- Every checkpoint holds the whole message history, so only the latest
+  `CHECKPOINT_KEEP` checkpoints of a thread are kept and large snapshots are
+  stored zlib compressed.
+
+`resume_runtime` restores the runtime of a checkpointed run, whose worktree
+only lives as long as the process.
+"""
+
+import asyncio
+import atexit
+import functools
+import logging
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from agent.constant import (
+    CHECKPOINT_BACKEND,
+    CHECKPOINT_COMPRESS_BYTES,
+    CHECKPOINT_FLUSH_SECONDS,
+    CHECKPOINT_KEEP,
+    CHECKPOINT_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CompressingSerializer:
+    """Serializer storing values larger than `min_bytes` zlib compressed, e.g. long message lists."""
+
+    PREFIX = "zlib:"
+
+    def __init__(self, serde=None, min_bytes=CHECKPOINT_COMPRESS_BYTES):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        if self.min_bytes and len(data) > self.min_bytes:
+            return self.PREFIX + type_, zlib.compress(data, 1)
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, value = data
+        if type_.startswith(self.PREFIX):
+            return self.serde.loads_typed((type_[len(self.PREFIX) :], zlib.decompress(value)))
+        return self.serde.loads_typed(data)
+
+
+class BatchedSqliteSaver(SqliteSaver):
+    """
+    `SqliteSaver` with batched commits, pruning of old checkpoints and async support.
+
+    The async methods run the synchronous ones in a worker thread, so the same
+    saver serves `stream` and `astream`.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the checkpoint database, shared by all threads
+        flush_seconds (float): Longest time a write stays uncommitted, 0 to commit every write
+        keep (int): Checkpoints kept per thread and namespace, 0 to keep all
+    """
+
+    def __init__(self, conn, *, flush_seconds=0.0, keep=0, serde=None):
+        super().__init__(conn, serde=serde or CompressingSerializer())
+        self.flush_seconds = flush_seconds
+        self.keep = keep
+        self._last_commit = time.monotonic()
+        self._touched = set()  # (thread_id, checkpoint_ns) written since the last commit
+        self._flush_timer = None
+
+    @classmethod
+    def from_path(cls, database_path, **kwargs):
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        conn = sqlite3.connect(database_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return cls(conn, **kwargs)
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        with self.lock:
+            self.setup()
+            cur = self.conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+                if transaction:
+                    if time.monotonic() - self._last_commit >= self.flush_seconds:
+                        self._commit()
+                    elif self._flush_timer is None:
+                        # commits the batch even if no later write comes
+                        self._flush_timer = threading.Timer(self.flush_seconds, self.flush)
+                        self._flush_timer.daemon = True
+                        self._flush_timer.start()
+
+    def _commit(self):
+        # called with `self.lock` held
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self.keep:
+            for thread_id, checkpoint_ns in self._touched:
+                self._prune(thread_id, checkpoint_ns)
+        self._touched.clear()
+        self.conn.commit()
+        self._last_commit = time.monotonic()
+
+    def _prune(self, thread_id, checkpoint_ns):
+        kept = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?"
+        )
+        args = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep)
+        self.conn.execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({kept})",
+            args,
+        )
+        self.conn.execute(
+            f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({kept})",
+            args,
+        )
+
+    def flush(self):
+        """Commit the pending writes."""
+        with self.lock:
+            if self.is_setup:
+                self._commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        with self.lock:
+            self._touched.add((str(configurable["thread_id"]), configurable["checkpoint_ns"]))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        tuples = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer(backend=CHECKPOINT_BACKEND):
+    """Creates the checkpointer configured by the `CHECKPOINT_*` env vars.
+
+    Returns:
+        checkpointer (BaseCheckpointSaver | None): The checkpointer, or None for the `none` backend."""
+    if backend == "none":
+        return None
+    if backend == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+
+        return MemorySaver()
+    if backend == "sqlite":
+        saver = BatchedSqliteSaver.from_path(
+            CHECKPOINT_PATH, flush_seconds=CHECKPOINT_FLUSH_SECONDS, keep=CHECKPOINT_KEEP
+        )
+        # writes of the last batch would only be committed by the next one
+        atexit.register(saver.flush)
+        return saver
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND {backend!r}")
+
+
+@functools.cache
+def get_checkpointer():
+    """The checkpointer shared by the graphs of this process, created on first use."""
+    return create_checkpointer()
+
+
+def flush_checkpoints():
+    """Commit the batched checkpoint writes, e.g. once a run is finished."""
+    checkpointer = get_checkpointer()
+    if isinstance(checkpointer, BatchedSqliteSaver):
+        checkpointer.flush()
+
+
+def resume_runtime(values, config):
+    """Restores the runtime of a run resumed from a checkpoint.
+
+    Checks the issue out again in a worktree of the run and applies the latest
+    patch of the checkpointed history, as left by the problem_solver.
+
+    Args:
+        values (dict): The checkpointed state of the run
+        config (RunnableConfig): Config of the run
+    Returns:
+        resumed (bool): Whether the runtime was restored, False when the issue isn't known yet"""
+    from agent.routing import latest_patch
+    from agent.runtime_config import RuntimeConfig
+
+    issue_url = values.get("preset")
+    if not issue_url or "/issues/" not in issue_url:
+        return False
+    rc = RuntimeConfig.from_config(config)
+    rc.load_from_github_issue_url(issue_url)
+    patch = latest_patch(values.get("messages", []))
+    if patch:
+        subprocess.run(
+            ["git", "apply", "--whitespace=nowarn"],
+            cwd=rc.proj_path,
+            input=patch + "\n",
+            text=True,
+            check=True,
+            capture_output=True,
+        )
+    logger.info(f"Resumed run {rc.run_id} at {rc.proj_path}")
+    return True
@@ -4,54 +4,196 @@ These constants include configuration settings, default values, and
 other immutable parameters used across different components of the system.
 """
 
+import functools
+import json
 import os
 
-import tree_sitter_java as tsjava
-import tree_sitter_python as tspython
-from tree_sitter import Language, Parser
+import dotenv
+
+# settings below can be overridden in the `.env` at project root
+dotenv.load_dotenv(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        ".env",
+    )
+)
 
 RUNTIME_DIR = os.path.join(os.environ["HOME"], "Tmp", "swe-runtime")
 
-PATCH_RESULT_DIR = os.path.join(RUNTIME_DIR, "results")
-os.makedirs(PATCH_RESULT_DIR, exist_ok=True)
+PATCH_RESULT_DIR = os.path.join(RUNTIME_DIR, "results")  # created when the first patch is saved
+
+# Bare per-project mirrors that working copies are materialized from
+MIRROR_DIR = os.path.join(RUNTIME_DIR, "mirrors")
+# Per-run worktrees allocated by `repo_cache.WorktreePool`
+WORKTREE_DIR = os.path.join(RUNTIME_DIR, "worktrees")
+# Number of idle worktrees kept per project for reuse by later runs
+MAX_IDLE_WORKTREES = int(os.environ.get("MAX_IDLE_WORKTREES", 4))
+# Optional directory holding `owner/project(.git|.bundle)` seeds for offline mirrors
+MIRROR_SEED_DIR = os.environ.get("MIRROR_SEED_DIR")
+# Create new mirrors as blobless (`--filter=blob:none`) partial clones
+GIT_PARTIAL_CLONE = os.environ.get("GIT_PARTIAL_CLONE", "1") != "0"
 
 REQUEST_TIMEOUT = 30
 
-# Tree-sitter parser and query definitions used for indexing
-PY_LANGUAGE = Language(tspython.language())
-JAVA_LANGUAGE = Language(tsjava.language())
+# Persistent cache of GitHub API responses, see `github_utils.cached_get`
+GITHUB_CACHE_DIR = os.path.join(RUNTIME_DIR, "github_cache")
+# Seconds a cached GitHub response is served without revalidating it
+GITHUB_CACHE_TTL = float(os.environ.get("GITHUB_CACHE_TTL", 600))
+# Seconds a resolved issue (description and closing commit) is reused, see `github_utils.resolve_issue`
+GITHUB_RESOLVED_TTL = float(os.environ.get("GITHUB_RESOLVED_TTL", 24 * 3600))
+# Pacing of GitHub API calls, further adapted to the `X-RateLimit-*` headers, see `rate_limiter.RateLimiter`
+GITHUB_REQUESTS_PER_SECOND = float(os.environ.get("GITHUB_REQUESTS_PER_SECOND", 5))
+GITHUB_REQUEST_BURST = int(os.environ.get("GITHUB_REQUEST_BURST", 10))
+# Serve GitHub API calls from the cache only, never touching the network
+GITHUB_OFFLINE = os.environ.get("GITHUB_OFFLINE", "0") == "1"
+# Optional JSON file pre-seeding the GitHub cache, see `github_utils.seed_github_cache`
+GITHUB_CACHE_SEED = os.environ.get("GITHUB_CACHE_SEED")
 
-tree_sitter_parsers = {
-    "py": Parser(PY_LANGUAGE),
-    "java": Parser(JAVA_LANGUAGE),
-}
+# LLM response cache, see `llm_cache.create_llm_cache`
+# Backend: `sqlite` (local file), `redis` (shared cache server) or `none`
+LLM_CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "sqlite").lower()
+# SQLite cache file, independent of the working directory
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH", os.path.join(RUNTIME_DIR, "llm_cache.sqlite")
+)
+# URL of the shared cache server used by the `redis` backend
+LLM_CACHE_URL = os.environ.get("LLM_CACHE_URL", "redis://localhost:6379/0")
+# Seconds a cached LLM response is served, 0 to keep responses until evicted
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 30 * 24 * 3600))
+# Size above which the least recently used responses are evicted from the SQLite cache
+LLM_CACHE_MAX_MB = float(os.environ.get("LLM_CACHE_MAX_MB", 512))
 
-query_py_func_defs = PY_LANGUAGE.query(
-    """(function_definition) @defs
-    """
+# How the supervisor and MAM pick the next agent, see `routing.route`:
+# `llm` always asks the LLM, `cache` reuses earlier LLM decisions for the same normalized state,
+# `rules` (default) also takes the obvious transitions without the LLM,
+# `sequential` additionally advances decoder -> mapper -> solver once an agent answered
+ROUTING_POLICY = os.environ.get("ROUTING_POLICY", "rules").lower()
+# Persistent cache of LLM routing decisions
+ROUTING_CACHE_DIR = os.path.join(RUNTIME_DIR, "routing_cache")
+ROUTING_CACHE_TTL = float(os.environ.get("ROUTING_CACHE_TTL", 7 * 24 * 3600))
+
+# Approximate token budget of the message history sent by an agent, see `context_window.compact_messages`;
+# `CONTEXT_TOKEN_BUDGET_<AGENT>` (e.g. `CONTEXT_TOKEN_BUDGET_PROBLEM_SOLVER`) overrides it per agent
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 64000))
+# Most recent messages whose tool outputs are never elided
+CONTEXT_KEEP_RECENT = int(os.environ.get("CONTEXT_KEEP_RECENT", 6))
+
+# Start a first retrieval on the issue (building the index) and the problem_decoder in parallel
+# as soon as the issue is loaded, instead of waiting for the supervisor
+SPECULATIVE_START = os.environ.get("SPECULATIVE_START", "0") == "1"
+
+# Number of problem_solver candidates run concurrently in their own worktrees, see `candidates.py`;
+# 1 runs a single problem_solver in the run's worktree
+PATCH_CANDIDATES = int(os.environ.get("PATCH_CANDIDATES", 1))
+# Comma separated sampling temperatures of the candidates, spread over 0-0.9 when unset
+CANDIDATE_TEMPERATURES = [
+    float(t) for t in os.environ.get("CANDIDATE_TEMPERATURES", "").split(",") if t.strip()
+]
+
+# Checkpoints of the graphs, see `checkpointer.create_checkpointer`
+# Backend: `sqlite` (local file), `memory` (lost with the process) or `none`
+CHECKPOINT_BACKEND = os.environ.get("CHECKPOINT_BACKEND", "sqlite").lower()
+CHECKPOINT_PATH = os.environ.get(
+    "CHECKPOINT_PATH", os.path.join(RUNTIME_DIR, "checkpoints.sqlite")
 )
-query_py_func_details = PY_LANGUAGE.query(
-    """
+# Longest time checkpoint writes are batched before they are committed, 0 to commit every write
+CHECKPOINT_FLUSH_SECONDS = float(os.environ.get("CHECKPOINT_FLUSH_SECONDS", 1))
+# Checkpoints kept per thread, 0 to keep the full history
+CHECKPOINT_KEEP = int(os.environ.get("CHECKPOINT_KEEP", 2))
+# Size above which checkpoint snapshots are stored compressed, 0 to never compress
+CHECKPOINT_COMPRESS_BYTES = int(os.environ.get("CHECKPOINT_COMPRESS_BYTES", 16 * 1024))
+
+# Per node, ReAct step, LLM and tool call metrics of the runs, see `metrics.py`
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Summary JSON of every finished run
+METRICS_DIR = os.path.join(RUNTIME_DIR, "metrics")
+# Optional file the process metrics are written to in the Prometheus text format
+METRICS_PROMETHEUS_PATH = os.environ.get("METRICS_PROMETHEUS_PATH")
+# Optional OTLP (gRPC) collector receiving the metrics as OpenTelemetry spans, e.g. `http://localhost:4317`
+METRICS_OTLP_ENDPOINT = os.environ.get("METRICS_OTLP_ENDPOINT")
+# Prices in USD per million tokens by model, for the LLM cost metrics, e.g.
+# `{"claude-3-7-sonnet-latest": {"input": 3, "cached": 0.3, "output": 15}}`
+LLM_PRICES = json.loads(os.environ.get("LLM_PRICES") or "{}")
+
+# Logging of the agent modules, see `run_logging.py`
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# `text` or `json` (one object per line)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# Characters of large logged values (file contents, edits, patches) kept, 0 for no limit
+LOG_PAYLOAD_CHARS = int(os.environ.get("LOG_PAYLOAD_CHARS", 500))
+
+
+# Tree-sitter parser and query definitions used for indexing, built on first access
+# (`constant.tree_sitter_parsers`, `constant.func_queries`, ...) to keep imports cheap
+@functools.cache
+def _tree_sitter_definitions():
+    import tree_sitter_java as tsjava
+    import tree_sitter_python as tspython
+    from tree_sitter import Language, Parser
+
+    PY_LANGUAGE = Language(tspython.language())
+    JAVA_LANGUAGE = Language(tsjava.language())
+
+    tree_sitter_parsers = {
+        "py": Parser(PY_LANGUAGE),
+        "java": Parser(JAVA_LANGUAGE),
+    }
+
+    query_py_func_defs = PY_LANGUAGE.query(
+        """(function_definition) @defs
+        """
+    )
+    query_py_func_details = PY_LANGUAGE.query(
+        """
+            name: (identifier) @name
+            parameters: (parameters) @args
+            body: (block) @block
+        """
+    )
+
+    query_java_method_decs = JAVA_LANGUAGE.query("(method_declaration) @defs")
+    query_java_construcor_decs = JAVA_LANGUAGE.query("(constructor_declaration) @defs")
+    query_java_method_details = JAVA_LANGUAGE.query(
+        """
         name: (identifier) @name
-        parameters: (parameters) @args
+        (modifiers) @mods
+        (void_type) @void_type
+        parameters: (formal_parameters) @args
         body: (block) @block
     """
-)
+    )
 
-query_java_method_decs = JAVA_LANGUAGE.query("(method_declaration) @defs")
-query_java_construcor_decs = JAVA_LANGUAGE.query("(constructor_declaration) @defs")
-query_java_method_details = JAVA_LANGUAGE.query(
-    """
-    name: (identifier) @name
-    (modifiers) @mods
-    (void_type) @void_type
-    parameters: (formal_parameters) @args
-    body: (block) @block
-"""
+    func_queries = {"py": query_py_func_defs, "java": query_java_method_decs}
+    func_detail_queries = {
+        "py": query_py_func_details,
+        "java": query_java_method_details,
+    }
+    return {
+        name: value
+        for name, value in locals().items()
+        if name in _TREE_SITTER_NAMES
+    }
+
+
+_TREE_SITTER_NAMES = (
+    "PY_LANGUAGE",
+    "JAVA_LANGUAGE",
+    "tree_sitter_parsers",
+    "query_py_func_defs",
+    "query_py_func_details",
+    "query_java_method_decs",
+    "query_java_construcor_decs",
+    "query_java_method_details",
+    "func_queries",
+    "func_detail_queries",
 )
 
-func_queries = {"py": query_py_func_defs, "java": query_java_method_decs}
-func_detail_queries = {"py": query_py_func_details, "java": query_java_method_details}
+
+def __getattr__(name):
+    if name in _TREE_SITTER_NAMES:
+        return _tree_sitter_definitions()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 PLACE_HOLDER_PATCH = """diff --git a/_random_file_1bx7.txt b/_random_file_1bx7.txt
 new file mode 100644
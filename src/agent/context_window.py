@@ -0,0 +1,134 @@
+"""
+Bounds the message history an agent sends to the LLM.
+
+Every agent appends its whole ReAct trajectory, including file views and tool
+outputs of up to 32k characters, to the shared `messages`, which later calls
+replay. `compact_messages` builds the view of the history sent to the LLM,
+leaving the graph state untouched:
+1. the latest patch supersedes the earlier ones
+2. a file view is replaced by a reference when the same lines, or the whole
+   file, are viewed again later
+3. while the history exceeds the agent's token budget (`context_budget`), the
+   oldest tool outputs are replaced by a reference to the tool call, keeping
+   the issue description and the most recent `CONTEXT_KEEP_RECENT` messages
+
+Only message contents are replaced, so tool calls stay paired with their
+results, and an output elided once stays elided as the history grows, so the
+prompt prefix cached by the provider only changes where outputs are elided.
+"""
+
+import json
+import logging
+import os
+
+from langchain_core.messages import ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from agent.constant import CONTEXT_KEEP_RECENT, CONTEXT_TOKEN_BUDGET
+from agent.routing import LATEST_PATCH_PREFIX
+
+logger = logging.getLogger(__name__)
+
+SUPERSEDED_PATCH = "[Earlier code changes, superseded by the latest code changes below]"
+# tool name -> argument holding the path of the viewed file
+FILE_VIEW_TOOLS = {"view_file_content": "file_name", "str_replace_editor": "path"}
+
+
+def context_budget(agent_name=None):
+    """Token budget of `agent_name`'s history, `CONTEXT_TOKEN_BUDGET_<AGENT>` or `CONTEXT_TOKEN_BUDGET`."""
+    if agent_name:
+        budget = os.getenv(f"CONTEXT_TOKEN_BUDGET_{agent_name.upper()}")
+        if budget:
+            return int(budget)
+    return CONTEXT_TOKEN_BUDGET
+
+
+def _tool_calls_by_id(messages):
+    return {
+        call["id"]: call
+        for message in messages
+        for call in getattr(message, "tool_calls", None) or []
+    }
+
+
+def _file_view(message, tool_calls):
+    """(path, view_range) of the file shown by the tool output `message`, None if it is no file view.
+
+    The range is None for a view of the whole file."""
+    argument = FILE_VIEW_TOOLS.get(message.name)
+    call = tool_calls.get(message.tool_call_id)
+    if not argument or not call:
+        return None
+    args = call.get("args") or {}
+    if message.name == "str_replace_editor" and args.get("command") != "view":
+        return None
+    path = args.get(argument)
+    if not path:
+        return None
+    view_range = args.get("view_range")
+    return os.path.normpath(path), tuple(view_range) if view_range else None
+
+
+def _reference(message, tool_calls, reason):
+    call = tool_calls.get(message.tool_call_id) or {}
+    args = json.dumps(call.get("args") or {}, sort_keys=True)
+    return f"[Output of {message.name}({args}) {reason}, call the tool again if it is needed]"
+
+
+def _replace_content(message, content):
+    return message.model_copy(update={"content": content})
+
+
+def compact_messages(messages, budget=None, keep_recent=CONTEXT_KEEP_RECENT):
+    """The messages to send to the LLM, compacted as described in the module docstring.
+
+    Args:
+        messages (list): The history, oldest first
+        budget (int, optional): Token budget of the history, defaults to `context_budget()`
+        keep_recent (int): Number of most recent messages never elided
+    Returns:
+        messages (list): The compacted history, same length and order as `messages`."""
+    budget = budget or context_budget()
+    messages = list(messages)
+    tool_calls = _tool_calls_by_id(messages)
+
+    patches = [
+        index
+        for index, message in enumerate(messages)
+        if isinstance(message.content, str) and message.content.startswith(LATEST_PATCH_PREFIX)
+    ]
+    for index in patches[:-1]:
+        messages[index] = _replace_content(messages[index], SUPERSEDED_PATCH)
+
+    viewed = set()  # (path, view_range) viewed later, the range is None for the whole file
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if not isinstance(message, ToolMessage):
+            continue
+        view = _file_view(message, tool_calls)
+        if view is None:
+            continue
+        # a view of other lines of the file doesn't replace this one, a whole file view does
+        if view in viewed or (view[0], None) in viewed:
+            messages[index] = _replace_content(
+                message, _reference(message, tool_calls, "elided, the file is viewed again later")
+            )
+        viewed.add(view)
+
+    tokens = count_tokens_approximately(messages)
+    if tokens <= budget:
+        return messages
+
+    for index in range(max(0, len(messages) - keep_recent)):
+        message = messages[index]
+        if not isinstance(message, ToolMessage):
+            continue
+        if message.content and not str(message.content).startswith("[Output of "):
+            elided = _replace_content(message, _reference(message, tool_calls, "elided"))
+            tokens -= count_tokens_approximately([message]) - count_tokens_approximately([elided])
+            messages[index] = elided
+            if tokens <= budget:
+                break
+    if tokens > budget:
+        logger.warning(f"History of ~{tokens} tokens exceeds the context budget of {budget} tokens")
+    return messages
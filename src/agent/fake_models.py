@@ -0,0 +1,271 @@
+"""
+Offline, deterministic stand-ins for the LLM and the embedding model.
+
+`FakeChatModel` answers from, in this order:
+1. a recorded transcript (`LLM_REPLAY_PATH`), looked up by a digest of the
+   request messages; transcripts are recorded from a real provider by setting
+   `LLM_RECORD_PATH` (see `TranscriptRecorder`)
+2. a script of responses (`FAKE_LLM_SCRIPT`), consumed in order
+3. a default answer: no tool calls, and for structured output the last option
+   of every `Literal` field, which routes the graphs to `FINISH`
+
+A script is a JSON list whose entries are either a string (the message
+content) or an object such as
+
+    {"content": "Let me look", "tool_calls": [{"name": "view_directory", "args": {"dir_path": "./"}}]}
+    {"structured": {"next_agent": "problem_decoder", "thought": "Start by decoding"}}
+
+`HashedNgramEmbeddings` maps text to hashed word and character n-gram vectors,
+so indexing and retrieval run without an embedding API.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import typing
+from collections import defaultdict
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+def _plain_content(content):
+    """Message content without prompt caching markers, which differ between providers."""
+    if isinstance(content, str):
+        return content
+    blocks = [
+        {k: v for k, v in block.items() if k != "cache_control"} if isinstance(block, dict) else block
+        for block in content
+    ]
+    if len(blocks) == 1 and isinstance(blocks[0], dict) and blocks[0].get("type") == "text":
+        return blocks[0]["text"]
+    return blocks
+
+
+def transcript_key(messages):
+    """Digest of a chat request, ignoring message and tool call ids and prompt caching markers."""
+    payload = [
+        {
+            "type": message.type,
+            "name": message.name,
+            "content": _plain_content(message.content),
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"]}
+                for call in getattr(message, "tool_calls", None) or []
+            ],
+        }
+        for message in messages
+    ]
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def load_transcript(path):
+    """Reads a JSONL transcript into a mapping of request digest to recorded responses."""
+    transcript = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                transcript[record["key"]].append(record["response"])
+    return dict(transcript)
+
+
+class TranscriptRecorder(BaseCallbackHandler):
+    """Appends every chat request digest and its response to a JSONL transcript."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}  # run_id -> request digest
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._pending[run_id] = transcript_key(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        key = self._pending.pop(run_id, None)
+        if key is None:
+            return
+        message = response.generations[0][0].message
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "response": message_to_dict(message)}) + "\n")
+
+
+def default_structured_output(schema):
+    """A deterministic instance of `schema`: the last option of `Literal` fields, empty values otherwise."""
+    if isinstance(schema, dict):
+        return {}
+    is_model = isinstance(schema, type) and issubclass(schema, BaseModel)
+    hints = (
+        {name: field.annotation for name, field in schema.model_fields.items()}
+        if is_model
+        else typing.get_type_hints(schema)
+    )
+    values = {}
+    for name, hint in hints.items():
+        if typing.get_origin(hint) is typing.Literal:
+            values[name] = typing.get_args(hint)[-1]
+        elif hint is str:
+            values[name] = ""
+        elif hint in (int, float, bool):
+            values[name] = hint()
+        elif typing.get_origin(hint) in (list, List):
+            values[name] = []
+        else:
+            values[name] = None
+    return values
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model replaying recorded or scripted responses, see the module docstring.
+
+    Args:
+        responses (list): Scripted responses, consumed in order
+        transcript (dict): Recorded responses by request digest, see `load_transcript`
+        strict (bool): Raise on requests missing from a non-empty transcript
+    """
+
+    responses: list = Field(default_factory=list)
+    transcript: dict = Field(default_factory=dict)
+    strict: bool = False
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _position: int = PrivateAttr(default=0)
+    _replayed: dict = PrivateAttr(default_factory=lambda: defaultdict(int))
+
+    @classmethod
+    def from_env(cls):
+        """Builds the model from `FAKE_LLM_SCRIPT`, `LLM_REPLAY_PATH` and `LLM_REPLAY_STRICT`."""
+        responses = []
+        if os.getenv("FAKE_LLM_SCRIPT"):
+            with open(os.environ["FAKE_LLM_SCRIPT"], encoding="utf-8") as f:
+                responses = json.load(f)
+        transcript = {}
+        if os.getenv("LLM_REPLAY_PATH"):
+            transcript = load_transcript(os.environ["LLM_REPLAY_PATH"])
+        return cls(
+            responses=responses,
+            transcript=transcript,
+            strict=os.getenv("LLM_REPLAY_STRICT", "0") == "1",
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _next_response(self, messages):
+        key = transcript_key(messages)
+        with self._lock:
+            recorded = self.transcript.get(key)
+            if recorded:
+                # repeated requests replay the recorded answers in order, then the last one
+                index = min(self._replayed[key], len(recorded) - 1)
+                self._replayed[key] += 1
+                return messages_from_dict([recorded[index]])[0]
+            if self.strict and self.transcript:
+                raise LookupError(f"Request {key} is not in the replayed transcript")
+            if self._position < len(self.responses):
+                self._position += 1
+                return self._scripted_message(self.responses[self._position - 1])
+        return AIMessage(content="")
+
+    def _scripted_message(self, response):
+        if isinstance(response, str):
+            return AIMessage(content=response)
+        if "structured" in response:
+            return AIMessage(content=json.dumps(response["structured"]))
+        tool_calls = [
+            {
+                "name": call["name"],
+                "args": call.get("args", {}),
+                "id": call.get("id") or f"call_{self._position}_{i}",
+            }
+            for i, call in enumerate(response.get("tool_calls", []))
+        ]
+        return AIMessage(content=response.get("content", ""), tool_calls=tool_calls)
+
+    def _generate(
+        self,
+        messages,
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._next_response(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        # the scripted or recorded tool calls are replayed as is
+        return self
+
+    def with_structured_output(self, schema, *, include_raw=False, **kwargs):
+        default = default_structured_output(schema)
+        is_model = isinstance(schema, type) and issubclass(schema, BaseModel)
+
+        def parse(message):
+            if message.tool_calls:
+                parsed = message.tool_calls[0]["args"]
+            else:
+                try:
+                    parsed = json.loads(message.content) if message.content else {}
+                except (TypeError, json.JSONDecodeError):
+                    parsed = {}
+            parsed = {**default, **parsed}
+            parsed = schema.model_validate(parsed) if is_model else parsed
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return self | RunnableLambda(parse)
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings from hashed word and character n-grams.
+
+    Identifiers are split on `snake_case` and `camelCase` boundaries, so
+    `get_issue_description` and `getIssueDescription` share most features.
+
+    Args:
+        dimensions (int): Size of the embedding vectors
+        char_ngram (int): Length of the character n-grams taken from each word
+    """
+
+    def __init__(self, dimensions=512, char_ngram=3):
+        self.dimensions = dimensions
+        self.char_ngram = char_ngram
+
+    def _features(self, text):
+        for token in re.findall(r"[A-Za-z0-9]+", text):
+            for word in re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", token) or [token]:
+                word = word.lower()
+                yield "w:" + word
+                padded = f"#{word}#"
+                for i in range(max(1, len(padded) - self.char_ngram + 1)):
+                    yield "c:" + padded[i : i + self.char_ngram]
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimensions] += sign
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector] if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
@@ -7,16 +7,41 @@ and other GitHub-specific data retrieval operations.
 
 Several Functions in this module require proper GitHub API authentication
 and some may depend on the external library`requests`.
+
+All API calls go through `cached_get`, which shares one pooled HTTP session,
+keeps responses in a persistent disk cache and revalidates them with
+ETag/If-None-Match conditional requests, so repeated runs on the same issue
+make zero or only `304 Not Modified` requests. The cache can be pre-seeded
+from a JSON file (`seed_github_cache`) to run offline against a local stand-in.
+
+Batch runs can resolve all their issues up front with `prefetch_issues`, so the
+graph startup path (`resolve_issue`) never blocks on GitHub.
 """
 
+import functools
+import json
 import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import dotenv
 import requests
+from diskcache import Cache
+from requests.adapters import HTTPAdapter
 
-from agent.constant import REQUEST_TIMEOUT
+from agent.constant import (
+    GITHUB_CACHE_DIR,
+    GITHUB_CACHE_SEED,
+    GITHUB_CACHE_TTL,
+    GITHUB_OFFLINE,
+    GITHUB_REQUEST_BURST,
+    GITHUB_REQUESTS_PER_SECOND,
+    GITHUB_RESOLVED_TTL,
+    REQUEST_TIMEOUT,
+)
+from agent.rate_limiter import RateLimiter
 
 dotenv.load_dotenv(
     os.path.join(
@@ -25,15 +50,131 @@ dotenv.load_dotenv(
     )
 )
 
-assert (
-    "GITHUB_TOKEN" in os.environ
-), "Please put your GITHUB_TOKEN in .env at project root!"
-
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-# Authentication header
-headers = {"Authorization": f"token {os.environ['GITHUB_TOKEN']}"}
+
+def get_headers():
+    """Authentication header, checked on the first request rather than at import."""
+    assert (
+        "GITHUB_TOKEN" in os.environ
+    ), "Please put your GITHUB_TOKEN in .env at project root!"
+    return {"Authorization": f"token {os.environ['GITHUB_TOKEN']}"}
+
+
+# Shared session so concurrent calls reuse pooled TLS connections
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# Paces all GitHub API calls of the process according to GitHub's rate limit headers
+github_rate_limiter = RateLimiter(
+    rate=GITHUB_REQUESTS_PER_SECOND, capacity=GITHUB_REQUEST_BURST
+)
+
+
+def github_request_metrics():
+    """Requests, retries, connection errors and pacing waits of the GitHub API calls, see `RateLimiter.metrics`."""
+    return github_rate_limiter.metrics()
+
+
+def wait_for_rate_limit(min_remaining):
+    """Sleep until the rate limit window resets if fewer than `min_remaining` calls are left."""
+    github_rate_limiter.wait_for_reserve(min_remaining)
+
+
+@functools.cache
+def get_github_cache():
+    """The persistent GitHub response cache, seeded from `GITHUB_CACHE_SEED` when set."""
+    cache = Cache(GITHUB_CACHE_DIR)
+    if GITHUB_CACHE_SEED:
+        seed_github_cache(GITHUB_CACHE_SEED, cache=cache)
+    return cache
+
+
+def _cache_key(url, params=None):
+    if not params:
+        return url
+    return url + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+
+
+def seed_github_cache(path, cache=None):
+    """Pre-seed the GitHub cache from a JSON file mapping request URLs to response bodies.
+
+    Values may also be full cache entries (`{"body": ..., "etag": ..., "link": ...}`) as
+    written by `export_github_cache`. Seeded entries never expire.
+    Args:
+        path (str): Path of the JSON seed file
+    Returns:
+        count (int): Number of seeded entries."""
+    cache = cache if cache is not None else get_github_cache()
+    with open(path, encoding="utf-8") as f:
+        seed = json.load(f)
+    for url, value in seed.items():
+        if not (isinstance(value, dict) and "body" in value and "fetched_at" in value):
+            value = {"body": value, "etag": None, "link": None}
+        value["fetched_at"] = float("inf")
+        cache.set(url, value)
+    return len(seed)
+
+
+def export_github_cache(path):
+    """Write all cached GitHub responses to a JSON file usable by `seed_github_cache`."""
+    cache = get_github_cache()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({key: cache.get(key) for key in cache.iterkeys()}, f)
+
+
+def cached_get(url, params=None):
+    """GET a GitHub API URL through the shared session and persistent cache.
+
+    Fresh entries (younger than `GITHUB_CACHE_TTL`) are served without any request,
+    stale ones are revalidated with `If-None-Match`.
+    Args:
+        url (str): The API URL
+        params (dict, optional): Query parameters
+    Returns:
+        entry (dict): The cache entry holding the decoded JSON `body`, its `etag` and `link` header.
+    Raises:
+        requests.HTTPError: If GitHub answers with an error status"""
+    cache = get_github_cache()
+    key = _cache_key(url, params)
+    entry = cache.get(key)
+    if entry is None and params:
+        # seeds usually hold the plain URL without query parameters
+        entry = cache.get(url)
+    if entry is not None and (
+        GITHUB_OFFLINE or time.time() - entry["fetched_at"] < GITHUB_CACHE_TTL
+    ):
+        return entry
+    if GITHUB_OFFLINE:
+        raise LookupError(f"{key} is not cached and GITHUB_OFFLINE is set")
+
+    request_headers = get_headers()
+    if entry is not None and entry.get("etag"):
+        request_headers["If-None-Match"] = entry["etag"]
+    response = github_rate_limiter.request(
+        lambda: session.get(
+            url, headers=request_headers, params=params, timeout=REQUEST_TIMEOUT
+        )
+    )
+
+    if response.status_code == 304 and entry is not None:
+        entry["fetched_at"] = time.time()
+    else:
+        response.raise_for_status()
+        entry = {
+            "body": response.json(),
+            "etag": response.headers.get("ETag"),
+            "link": response.headers.get("Link"),
+            "fetched_at": time.time(),
+        }
+    cache.set(key, entry)
+    return entry
+
+
+def get_json(url, params=None):
+    """Decoded JSON body of a (cached) GitHub API GET request."""
+    return cached_get(url, params)["body"]
 
 
 def parse_github_issue_url(issue_url):
@@ -61,37 +202,87 @@ def get_issue_description(owner, project, issue):
         issue_description (str): The corresponding issue description."""
     issue_api_url = f"https://api.github.com/repos/{owner}/{project}/issues/{issue}"
 
-    response = requests.get(issue_api_url, headers=headers, timeout=REQUEST_TIMEOUT)
-
-    # Check for successful response (HTTP status 200)
-    if response.status_code == 200:
-        issue_data = response.json()
-        issue_description = issue_data.get("body", "No description available.")
-        return issue_description
-    else:
+    try:
+        issue_data = get_json(issue_api_url)
+    except requests.HTTPError as e:
         # Handle errors
-        print(f"Error fetching issue details: {response.status_code}")
-        print("Response content:", response.text)
+        print(f"Error fetching issue details: {e.response.status_code}")
+        print("Response content:", e.response.text)
         return None
+    issue_description = issue_data.get("body", "No description available.")
+    return issue_description
 
 
 # Fetch issue events to find the one that closed the issue
 def get_issue_events(url_):
-    response = requests.get(url_, headers=headers, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()  # Raise an error for bad responses
-    return response.json()
+    return get_json(url_)  # Raises an error for bad responses
+
+
+def parse_link_header(link):
+    """Map each `rel` of a GitHub pagination `Link` header to its URL."""
+    links = {}
+    for part in (link or "").split(","):
+        match = re.match(r'\s*<([^>]+)>;\s*rel="([^"]+)"', part)
+        if match:
+            links[match.group(2)] = match.group(1)
+    return links
+
+
+def iter_issue_events(owner, project, issue, newest_first=True, per_page=100):
+    """Lazily iterate over the events of an issue, following `Link` pagination headers.
+
+    Pages are only fetched as the iterator advances, so callers that stop early
+    don't pay for the remaining pages.
+    Args:
+        owner (str): Owner of the project
+        project (str): Name of the project
+        issue (Union[str, int]): Issue ID
+        newest_first (bool): Start from the last page and walk backwards
+        per_page (int): Events per page, at most 100
+    Yields:
+        event (dict): The issue events."""
+    event_url = f"https://api.github.com/repos/{owner}/{project}/issues/{issue}/events"
+    entry = cached_get(event_url, {"per_page": per_page})
+    links = parse_link_header(entry["link"])
+
+    if newest_first and "last" in links:
+        direction = "prev"
+        entry = cached_get(links["last"])
+        links = parse_link_header(entry["link"])
+    else:
+        direction = "next"
+
+    while True:
+        events = entry["body"]
+        yield from reversed(events) if newest_first else events
+        if direction not in links:
+            return
+        entry = cached_get(links[direction])
+        links = parse_link_header(entry["link"])
 
 
 # Fetch issue details to check for a linked PR
 def get_issue_details(url_):
-    response = requests.get(url_, headers=headers, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()  # Raise an error for bad responses
-    return response.json()
+    return get_json(url_)  # Raises an error for bad responses
+
+
+def get_pr_merge_commit(pr_url):
+    """Merge commit SHA of a pull request, or an empty string if it isn't merged."""
+    pr_details = get_json(pr_url)
+    if pr_details["merged_at"]:
+        logger.info(f"Pull Request was merged at: {pr_details['merged_at']}")
+        return pr_details["merge_commit_sha"] or ""
+    logger.info("The pull request is not merged yet.")
+    return ""
 
 
 # Main logic
 def get_issue_close_commit(owner, project, issue):
     """Retrieves the commit that closed the pull request corresponding to a given issue.
+
+    A merged pull request resolves to its `merge_commit_sha`; otherwise the issue events
+    are scanned newest first and the scan stops at the latest closing event carrying a
+    commit (or linking a merged pull request).
     Args:
         owner (str): Owner of the project
         project (str): Name of the project
@@ -100,42 +291,90 @@ def get_issue_close_commit(owner, project, issue):
         commit_id_to_return (str): The corresponding commit SHA."""
     # Fetch the issue details
     issue_url = f"https://api.github.com/repos/{owner}/{project}/issues/{issue}"
-    event_url = f"https://api.github.com/repos/{owner}/{project}/issues/{issue}/events"
-    issue = get_issue_details(issue_url)
+    issue_details = get_issue_details(issue_url)
 
     # Check if the issue has a linked pull request
-    if "pull_request" in issue:
-        pr_url = issue["pull_request"]["url"]
+    if "pull_request" in issue_details:
+        pr_url = issue_details["pull_request"]["url"]
         logger.info(f"Pull Request that closed the issue: {pr_url}")
 
-        # Fetch the pull request details
-        pr_response = requests.get(pr_url, headers=headers, timeout=REQUEST_TIMEOUT)
-        pr_response.raise_for_status()
-        pr_details = pr_response.json()
-
         # Check for commit associated with the pull request
-        if pr_details["merged_at"]:
-            logger.info(f"Pull Request was merged at: {pr_details['merged_at']}")
-            logger.info(
-                f"Commit that closed the issue: {pr_details['merge_commit_sha']}"
-            )
-        else:
-            logger.info("The pull request is not merged yet.")
+        merge_commit_sha = get_pr_merge_commit(pr_url)
+        if merge_commit_sha:
+            logger.info(f"Commit that closed the issue: {merge_commit_sha}")
+            return merge_commit_sha
     else:
         logger.info("No pull request linked to the issue.")
-    # Fetch the events of the issue
-    events = get_issue_events(event_url)
-    commit_id_to_return = ""
-    for event in events:
-        # print(event)
-        if event["event"] == "closed":
-            if "commit_id" in event:
-                logger.info(f"Commit that closed the issue: {event['commit_id']}")
-                commit_id_to_return = event["commit_id"]
-            elif "pull_request" in event:
-                pr_url = event["pull_request"]["url"]
-                logger.info(f"Pull Request that closed the issue: {pr_url}")
-    return commit_id_to_return
+
+    # Scan the events of the issue, newest first
+    for event in iter_issue_events(owner, project, issue):
+        if event["event"] != "closed":
+            continue
+        if event.get("commit_id"):
+            logger.info(f"Commit that closed the issue: {event['commit_id']}")
+            return event["commit_id"]
+        if event.get("pull_request"):
+            pr_url = event["pull_request"]["url"]
+            logger.info(f"Pull Request that closed the issue: {pr_url}")
+            merge_commit_sha = get_pr_merge_commit(pr_url)
+            if merge_commit_sha:
+                return merge_commit_sha
+    return ""
+
+
+def resolve_issue(owner, project, issue, refresh=False):
+    """Description and closing commit of an issue, reused for `GITHUB_RESOLVED_TTL` seconds.
+
+    Args:
+        owner (str): Owner of the project
+        project (str): Name of the project
+        issue (Union[str, int]): Issue ID
+        refresh (bool): Ignore a previously resolved result
+    Returns:
+        (issue_description, commit_id) (tuple[str, str]): See `get_issue_description` and `get_issue_close_commit`."""
+    cache = get_github_cache()
+    key = ("resolved", owner, project, str(issue))
+    resolved = None if refresh else cache.get(key)
+    if resolved is None:
+        resolved = (
+            get_issue_description(owner, project, issue),
+            get_issue_close_commit(owner, project, issue),
+        )
+        if resolved[0] is not None:
+            cache.set(key, resolved, expire=GITHUB_RESOLVED_TTL)
+    return resolved
+
+
+def prefetch_issues(issue_urls, max_workers=8, min_remaining=100):
+    """Resolve many issues concurrently into the cache before any graph starts.
+
+    Workers pause whenever GitHub reports fewer than `min_remaining` calls left
+    in the current rate limit window.
+    Args:
+        issue_urls (Iterable[str]): GitHub issue URLs
+        max_workers (int): Number of concurrent fetches
+        min_remaining (int): Rate limit reserve kept for the runs themselves
+    Returns:
+        errors (dict): Issue URL -> error message for the issues that failed."""
+
+    def fetch(issue_url):
+        owner, project, issue = parse_github_issue_url(issue_url)
+        if not owner:
+            raise ValueError(f"Invalid GitHub issue URL passed in: {issue_url}")
+        wait_for_rate_limit(min_remaining)
+        resolve_issue(owner, project, issue)
+
+    errors = {}
+    issue_urls = list(dict.fromkeys(issue_urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {url: executor.submit(fetch, url) for url in issue_urls}
+        for url, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                errors[url] = repr(e)
+    logger.info(f"Prefetched {len(issue_urls) - len(errors)}/{len(issue_urls)} issues")
+    return errors
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 # %%
+import asyncio
+import functools
 import os
 from typing import Literal
 import uuid
@@ -11,19 +13,22 @@ from langgraph.types import Command
 from langchain_core.messages import AIMessage, HumanMessage
 from typing_extensions import TypedDict
 
-from agent.llm import llm
+from agent.context_window import compact_messages, context_budget
+from agent.llm import get_llm
+from agent.metrics import install_metrics
+from agent.prompt_caching import bind_agent_tools, cached_state_modifier, prompt_messages
 from agent.prompt import (
     ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT,
     ISSUE_RESOLVE_MAM_SYSTEM_PROMPT,
 )
-from agent.runtime_config import RuntimeConfig
+from agent.runtime_config import RuntimeConfig, install_runtime_release
+from agent.routing import mam_rule, route
 from agent.state import CustomState
+from agent.tool_node import ConcurrentToolNode
 from agent.supervisor_graph_demo import issue_resolve_graph
 from agent.tool_set.context_tools import search_relevant_files
 from agent.tool_set.sepl_tools import view_file_content, view_directory, run_shell_cmd
 
-rc = RuntimeConfig()
-
 reviewer_tools = [
     view_directory,
     search_relevant_files,
@@ -38,6 +43,11 @@ dotenv.load_dotenv(
     )
 )
 
+# per node, step and tool metrics of every run of the graph
+install_metrics()
+# the worktree of a run goes back to the pool when the run finishes
+install_runtime_release()
+
 
 class MamRouter(TypedDict):
     """Worker to route to next. If no workers needed, route to FINISH."""
@@ -50,11 +60,17 @@ class MamRouter(TypedDict):
 def mam_node(
     state: CustomState,
 ) -> Command[Literal["issue_resolve_graph", "reviewer_node"]]:
-    messages = [
-        {"role": "system", "content": ISSUE_RESOLVE_MAM_SYSTEM_PROMPT},
-    ] + state["messages"]
+    messages = prompt_messages(
+        ISSUE_RESOLVE_MAM_SYSTEM_PROMPT,
+        compact_messages(state["messages"], context_budget("mam")),
+    )
 
-    response = llm.with_structured_output(MamRouter, strict=True).invoke(messages)
+    response = route(
+        "MAM",
+        state,
+        mam_rule,
+        lambda: get_llm().with_structured_output(MamRouter, strict=True).invoke(messages),
+    )
 
     next_agent = response["next_agent"]
     print(f"Next agent: {next_agent}")
@@ -85,15 +101,18 @@ def mam_node(
     )
 
 
-reviewer_agent = create_react_agent(
-    llm,
-    tools=reviewer_tools,
-    state_modifier=ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT,
-)
+@functools.cache
+def get_reviewer_agent():
+    # built on first run so importing the graph doesn't create the LLM
+    return create_react_agent(
+        bind_agent_tools(get_llm(), reviewer_tools, "reviewer"),
+        tools=ConcurrentToolNode(reviewer_tools),
+        state_modifier=cached_state_modifier(ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT, "reviewer"),
+    )
 
 
-def reviewer_node(state: CustomState) -> Command[Literal["mam_node"]]:
-    result = reviewer_agent.invoke(state)
+async def reviewer_node(state: CustomState) -> Command[Literal["mam_node"]]:
+    result = await get_reviewer_agent().ainvoke(state)
     new_messages = result["messages"][len(state["messages"]) :]
     last_message = new_messages[-1]
     # Add name to each AI message
@@ -132,6 +151,7 @@ builder.add_edge(START, "mam_node")
 builder.add_edge("issue_resolve_graph", "mam_node")
 
 
+# the LangGraph server provides the persistence, the batch driver and `__main__` add a checkpointer
 hierarchy_graph = builder.compile()
 
 
@@ -144,7 +164,7 @@ if __name__ == "__main__":
         "recursion_limit": 100,
         "run_id": uuid.uuid4(),
         "tags": ["interrupt"],
-        "configurable": {"thread_id": "1"},
+        "configurable": {"thread_id": str(uuid.uuid4())},
     }
     initial_input = {
         "messages": [
@@ -156,8 +176,18 @@ if __name__ == "__main__":
         "human_in_the_loop": False,
     }
 
-    for chunk in hierarchy_graph.stream(
-        initial_input, config=thread, stream_mode="values"
-    ):
-        if "messages" in chunk and len(chunk["messages"]) > 0:
-            chunk["messages"][-1].pretty_print()
+    from agent.checkpointer import get_checkpointer
+    from agent.run_logging import setup_logging
+
+    setup_logging()
+    graph = builder.compile(checkpointer=get_checkpointer())
+
+    async def main():
+        # the agent nodes are async, so the graph runs with the async API
+        async for chunk in graph.astream(
+            initial_input, config=thread, stream_mode="values"
+        ):
+            if "messages" in chunk and len(chunk["messages"]) > 0:
+                chunk["messages"][-1].pretty_print()
+
+    asyncio.run(main())
@@ -1,22 +1,51 @@
 """
 Defines the LLM based on the `LLM_PROVIDER` and `LLM_MODEL` env vars.
+`LLM_PROVIDER=fake` or `replay` selects the offline `agent.fake_models.FakeChatModel`.
+
+The provider SDK and the LLM cache are only imported and set up when the LLM
+is first requested through `get_llm` (or the lazily resolved `llm` attribute),
+so importing the agent modules stays cheap.
 """
 
+import functools
 import os
 
-from langchain_anthropic import ChatAnthropic
-from langchain_community.cache import SQLiteCache
-from langchain_core.globals import set_llm_cache
-from langchain_deepseek import ChatDeepSeek
-from langchain_openai import ChatOpenAI
-
+from agent.runtime_config import load_env_config
 from agent.utils import UndefinedValueError
 
-from agent.runtime_config import load_env_config
+load_env_config()
 
-set_llm_cache(SQLiteCache(database_path=".langchain.db"))
 
-load_env_config()
+@functools.cache
+def setup_llm_cache():
+    """Installs the global langchain LLM cache configured by the `LLM_CACHE_*` env vars, once.
+
+    Returns:
+        cache (MeteredCache | None): The installed cache, see `agent.llm_cache`."""
+    from langchain_core.globals import set_llm_cache
+
+    from agent.llm_cache import create_llm_cache
+
+    cache = create_llm_cache()
+    set_llm_cache(cache)
+    return cache
+
+
+def llm_cache_metrics():
+    """Hits, misses and hit rate of the LLM cache per model, empty if no cache is installed."""
+    if not setup_llm_cache.cache_info().currsize:
+        return {}
+    cache = setup_llm_cache()
+    return cache.metrics() if cache else {}
+
+
+def prompt_cache_metrics():
+    """Input tokens served from the provider's prompt cache per model, see `agent.prompt_caching`."""
+    if not get_llm.cache_info().currsize:
+        return {}
+    from agent.prompt_caching import prompt_cache_usage
+
+    return prompt_cache_usage.metrics()
 
 
 def create_llm():
@@ -26,25 +55,60 @@ def create_llm():
     if not llm_provider:
         raise UndefinedValueError("LLM_PROVIDER")
     llm_name = os.getenv("LLM_MODEL")
+    if llm_provider.lower() in ("fake", "replay"):
+        # offline and deterministic, never cached so scripts replay in order
+        from agent.fake_models import FakeChatModel
+
+        if llm_provider.lower() == "replay" and not os.getenv("LLM_REPLAY_PATH"):
+            raise UndefinedValueError("LLM_REPLAY_PATH")
+        return FakeChatModel.from_env()
+
+    setup_llm_cache()
+    # only the SDK of the selected provider is imported
     if "openai" in llm_provider.lower():
+        from langchain_openai import ChatOpenAI
+
         created_llm = ChatOpenAI(
             model=llm_name, temperature=0.0, max_tokens=2048, cache=True
         )
     elif "anthropic" in llm_provider.lower():
+        from langchain_anthropic import ChatAnthropic
+
         created_llm = ChatAnthropic(
             model=llm_name, temperature=0.0, max_tokens=2048, cache=True
         )
     elif "deepseek" in llm_provider.lower():
+        from langchain_deepseek import ChatDeepSeek
+
         created_llm = ChatDeepSeek(
             model=llm_name, temperature=0.0, max_tokens=2048, cache=True
         )
 
     if not created_llm or not llm_name:
         raise UndefinedValueError("LLM_MODEL")
+    from agent.prompt_caching import prompt_cache_usage
+
+    created_llm.callbacks = [prompt_cache_usage]
+    if os.getenv("LLM_RECORD_PATH"):
+        from agent.fake_models import TranscriptRecorder
+
+        # transcripts for `LLM_PROVIDER=replay`
+        created_llm.callbacks.append(TranscriptRecorder(os.environ["LLM_RECORD_PATH"]))
     return created_llm
 
 
-llm = create_llm()
+@functools.cache
+def get_llm():
+    """The shared LLM, created on first use."""
+    return create_llm()
+
+
+def __getattr__(name):
+    # keeps `from agent.llm import llm` working, at the cost of creating the LLM on import
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    print(llm.invoke("Tell me a joke"))
+    print(get_llm().invoke("Tell me a joke"))
@@ -0,0 +1,282 @@
+"""
+Response caches for the LLM, installed by `llm.setup_llm_cache`.
+
+`BoundedSQLiteCache` keeps responses in a SQLite file at an absolute location
+(`LLM_CACHE_PATH`), so every run hits the same cache wherever it is launched
+from. The database runs in WAL mode so concurrent processes can read while one
+of them writes, responses are namespaced per model, expire after
+`LLM_CACHE_TTL` seconds and the least recently used ones are evicted once the
+cache grows beyond `LLM_CACHE_MAX_MB`.
+
+With `LLM_CACHE_BACKEND=redis` all workers share one cache server instead
+(`LLM_CACHE_URL`), whose memory bound is configured on the server.
+
+Every backend is wrapped in a `MeteredCache` counting hits and misses per model.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from collections import defaultdict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from agent.constant import (
+    LLM_CACHE_BACKEND,
+    LLM_CACHE_MAX_MB,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL,
+    LLM_CACHE_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _quiet(function, value):
+    """Calls the serialization `function`, without its beta status and defaults warnings
+    that would otherwise be emitted on every cache hit."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="The function `(?:loads|dumps)` is in beta")
+        warnings.filterwarnings("ignore", message="The default value of `allowed_objects`")
+        return function(value)
+
+
+_MODEL_PATTERN = re.compile(r"""["']model(?:_name)?["']\s*[,:]\s*["']([^"']+)["']""")
+
+
+def model_namespace(llm_string):
+    """Name of the model an `llm_string` describes, used to namespace its cache entries."""
+    match = _MODEL_PATTERN.search(llm_string)
+    return match.group(1) if match else "default"
+
+
+class BoundedSQLiteCache(BaseCache):
+    """
+    SQLite LLM cache shared by threads and processes, with TTL and size bounded LRU eviction.
+
+    Args:
+        database_path (str): Location of the SQLite file
+        ttl (float): Seconds an entry is served, 0 to disable expiry
+        max_bytes (int): Total size of the cached responses above which the
+            least recently used ones are evicted, 0 to disable
+    """
+
+    # entries are only touched again after this many seconds, to keep lookups read-only
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, database_path, ttl=0, max_bytes=0):
+        self.database_path = os.path.abspath(database_path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._written = 0  # bytes written since the last eviction check
+
+        os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed);
+            """
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.database_path, timeout=30, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        namespace, key = model_namespace(llm_string), self._key(prompt, llm_string)
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, created, accessed FROM llm_cache WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, created, accessed = row
+        now = time.time()
+        if self.ttl and now - created > self.ttl:
+            connection.execute(
+                "DELETE FROM llm_cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            return None
+        if now - accessed > self.ACCESS_RESOLUTION:
+            connection.execute(
+                "UPDATE llm_cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        try:
+            return _quiet(loads, value)
+        except Exception:
+            logger.warning(f"Dropping unreadable LLM cache entry {namespace}/{key}")
+            return None
+
+    def update(self, prompt, llm_string, return_val):
+        value = _quiet(dumps, return_val)
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                model_namespace(llm_string),
+                self._key(prompt, llm_string),
+                value,
+                len(value),
+                now,
+                now,
+            ),
+        )
+        with self._lock:
+            self._written += len(value)
+            # checking the size on every write would make updates O(n)
+            check = self.max_bytes and self._written > self.max_bytes / 20
+            if check:
+                self._written = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until the cache fits `max_bytes`."""
+        connection = self._connection()
+        if self.ttl:
+            connection.execute(
+                "DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,)
+            )
+        if not self.max_bytes:
+            return
+        total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # evict down to 90% so the next writes don't immediately trigger another round
+        excess = total - 0.9 * self.max_bytes
+        freed = 0
+        evicted = []
+        cursor = connection.execute(
+            "SELECT namespace, key, size FROM llm_cache ORDER BY accessed"
+        )
+        for namespace, key, size in cursor:
+            evicted.append((namespace, key))
+            freed += size
+            if freed >= excess:
+                break
+        cursor.close()
+        connection.executemany(
+            "DELETE FROM llm_cache WHERE namespace = ? AND key = ?", evicted
+        )
+        logger.info(f"Evicted {len(evicted)} LLM cache entries ({freed} bytes)")
+
+    def clear(self, namespace=None, **kwargs):
+        """Remove all entries, or only those of the model `namespace`."""
+        if namespace is None:
+            self._connection().execute("DELETE FROM llm_cache")
+        else:
+            self._connection().execute(
+                "DELETE FROM llm_cache WHERE namespace = ?", (namespace,)
+            )
+
+    def stats(self):
+        """Number of entries and their total size per namespace."""
+        return {
+            namespace: {"entries": entries, "bytes": size}
+            for namespace, entries, size in self._connection().execute(
+                "SELECT namespace, COUNT(*), SUM(size) FROM llm_cache GROUP BY namespace"
+            )
+        }
+
+
+class MeteredCache(BaseCache):
+    """Wraps a cache, counting hits and misses per model namespace."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def _record(self, llm_string, hit):
+        with self._lock:
+            self._counts[model_namespace(llm_string)]["hits" if hit else "misses"] += 1
+
+    def lookup(self, prompt, llm_string):
+        result = self.cache.lookup(prompt, llm_string)
+        self._record(llm_string, result is not None)
+        return result
+
+    async def alookup(self, prompt, llm_string):
+        result = await self.cache.alookup(prompt, llm_string)
+        self._record(llm_string, result is not None)
+        return result
+
+    def update(self, prompt, llm_string, return_val):
+        self.cache.update(prompt, llm_string, return_val)
+
+    async def aupdate(self, prompt, llm_string, return_val):
+        await self.cache.aupdate(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs):
+        self.cache.clear(**kwargs)
+
+    def metrics(self):
+        """Hits, misses and hit rate per model namespace."""
+        with self._lock:
+            counts = {namespace: dict(c) for namespace, c in self._counts.items()}
+        for c in counts.values():
+            lookups = c["hits"] + c["misses"]
+            c["hit_rate"] = c["hits"] / lookups if lookups else 0.0
+        return counts
+
+
+def create_llm_cache(backend=LLM_CACHE_BACKEND):
+    """Creates the LLM cache configured by the `LLM_CACHE_*` env vars.
+
+    Returns:
+        cache (MeteredCache | None): The cache, or None for the `none` backend."""
+    if backend == "none":
+        return None
+    if backend == "redis":
+        from langchain_community.cache import RedisCache
+
+        try:
+            from redis import Redis
+        except ImportError as e:
+            raise ImportError(
+                "LLM_CACHE_BACKEND=redis requires the `redis` package, install it with `pip install 'codexray_lite[redis]'`"
+            ) from e
+
+        cache = RedisCache(Redis.from_url(LLM_CACHE_URL), ttl=int(LLM_CACHE_TTL) or None)
+    elif backend == "sqlite":
+        cache = BoundedSQLiteCache(
+            LLM_CACHE_PATH,
+            ttl=LLM_CACHE_TTL,
+            max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+        )
+    else:
+        raise ValueError(f"Unknown LLM_CACHE_BACKEND {backend!r}")
+    return MeteredCache(cache)
@@ -0,0 +1,446 @@
+"""
+Latency, token and cost metrics of the graph runs, installed by `install_metrics`.
+
+`RunMetrics` is a callback handler added to every run of the process (through a
+langchain configure hook, like LangSmith tracing), so nested agents, tools and
+LLM calls are covered without passing callbacks around. Per run (`thread_id`)
+it records:
+- per graph node and per ReAct step of each agent: calls, wall time, errors
+- per agent: LLM calls, wall time, input/output/cached tokens, LLM cache hits and cost
+- per tool: calls, wall time, bytes returned, errors
+
+The metrics are exported as:
+- a summary JSON per run in `METRICS_DIR`, written when the run finishes
+- Prometheus text (`prometheus_text`), also written to `METRICS_PROMETHEUS_PATH`
+  for a node exporter textfile collector when set
+- OpenTelemetry spans sent to the OTLP collector at `METRICS_OTLP_ENDPOINT` when set
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from agent.constant import (
+    LLM_PRICES,
+    METRICS_DIR,
+    METRICS_ENABLED,
+    METRICS_OTLP_ENDPOINT,
+    METRICS_PROMETHEUS_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# nodes of `create_react_agent`, reported as steps of the agent running them
+REACT_NODES = ("agent", "tools")
+# summaries of finished runs kept for `run_summary`, the oldest are dropped
+FINISHED_RUNS = 256
+
+
+def _node_path(metadata):
+    """Names of the nested graph nodes a callback event belongs to, outermost first."""
+    checkpoint_ns = (metadata or {}).get("langgraph_checkpoint_ns") or ""
+    return [segment.split(":")[0] for segment in checkpoint_ns.split("|") if segment]
+
+
+def _owner(path):
+    """The agent (graph node) that runs the ReAct node or makes the call at `path`."""
+    if len(path) > 1 and path[-1] in REACT_NODES:
+        return path[-2]
+    return path[-1] if path else "default"
+
+
+def _output_bytes(output):
+    content = getattr(output, "content", output)
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    return len(content.encode("utf-8"))
+
+
+def llm_cost(model, input_tokens, cached_tokens, output_tokens):
+    """Cost of an LLM call from `LLM_PRICES` (per million tokens), None for models without prices."""
+    prices = LLM_PRICES.get(model)
+    if not prices:
+        return None
+    uncached = input_tokens - cached_tokens
+    return (
+        uncached * prices.get("input", 0)
+        + cached_tokens * prices.get("cached", prices.get("input", 0))
+        + output_tokens * prices.get("output", 0)
+    ) / 1e6
+
+
+def _new_run():
+    return {
+        "started": time.time(),
+        "wall_time": 0.0,
+        "nodes": defaultdict(lambda: {"calls": 0, "seconds": 0.0, "errors": 0}),
+        "steps": defaultdict(lambda: {"calls": 0, "seconds": 0.0, "errors": 0}),
+        "llm": defaultdict(
+            lambda: {
+                "calls": 0,
+                "seconds": 0.0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cached_tokens": 0,
+                "cache_hits": 0,
+                "cost": 0.0,
+                "errors": 0,
+            }
+        ),
+        "tools": defaultdict(lambda: {"calls": 0, "seconds": 0.0, "bytes": 0, "errors": 0}),
+    }
+
+
+class RunMetrics(BaseCallbackHandler):
+    """
+    Callback recording per node, ReAct step, LLM call and tool call metrics of every run.
+
+    Args:
+        metrics_dir (str, optional): Directory of the per-run summary JSON files, None to not write them
+        spans (OtelSpans, optional): Also reports every event as an OpenTelemetry span
+    """
+
+    def __init__(self, metrics_dir=None, spans=None):
+        self.metrics_dir = metrics_dir
+        self.spans = spans
+        self._lock = threading.Lock()
+        self._runs = defaultdict(_new_run)
+        self._finished = OrderedDict()  # thread_id -> summary of the finished runs
+        # process totals over all runs, for Prometheus
+        self._totals = _new_run()
+        self._active = {}  # run_id -> (kind, name, thread_id, start)
+
+    def _start(self, run_id, parent_run_id, kind, name, metadata):
+        thread_id = str((metadata or {}).get("thread_id", "default"))
+        with self._lock:
+            if kind == "run":
+                # a resumed run is measured from its restart
+                self._runs[thread_id]["started"] = time.time()
+            self._active[run_id] = (kind, name, thread_id, time.perf_counter())
+        if self.spans:
+            self.spans.start(run_id, parent_run_id, f"{kind} {name}", {"thread_id": thread_id})
+
+    def _end(self, run_id, error=None, **values):
+        """Accounts the event `run_id` started by `_start`, returns its kind and run."""
+        with self._lock:
+            active = self._active.pop(run_id, None)
+            if active is None:
+                return None
+            kind, name, thread_id, start = active
+            seconds = time.perf_counter() - start
+            accounted = (self._runs[thread_id], self._totals) if kind != "run" else ()
+            for metrics in accounted:
+                entry = metrics[kind][name]
+                entry["calls"] += 1
+                entry["seconds"] += seconds
+                entry["errors"] += error is not None
+                for key, value in values.items():
+                    entry[key] += value
+        if self.spans:
+            self.spans.end(run_id, {"seconds": seconds, **values}, error)
+        return kind, thread_id
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        if self.spans:
+            self.spans.link(run_id, parent_run_id)
+        if parent_run_id is None:
+            if (metadata or {}).get("thread_id") is not None:
+                self._start(run_id, None, "run", name, metadata)
+            return
+        path = _node_path(metadata)
+        if not path or name != (metadata or {}).get("langgraph_node") or name != path[-1]:
+            return  # not a graph node
+        if name == "agent" and len(path) > 1:
+            self._start(run_id, parent_run_id, "steps", _owner(path), metadata)
+        elif name not in REACT_NODES:
+            self._start(run_id, parent_run_id, "nodes", name, metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish_chain(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish_chain(run_id, error)
+
+    def _finish_chain(self, run_id, error=None):
+        ended = self._end(run_id, error)
+        if self.spans:
+            self.spans.unlink(run_id)
+        if ended and ended[0] == "run":
+            self.finish_run(ended[1])
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", _owner(_node_path(metadata)), metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", _owner(_node_path(metadata)), metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        values = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_hits": 0, "cost": 0.0}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                # langchain zeroes the cost of responses served from the LLM cache
+                hit = usage.get("total_cost") == 0
+                cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+                metadata = message.response_metadata or {}
+                model = metadata.get("model_name") or metadata.get("model") or "default"
+                if hit:
+                    # no tokens were sent to the provider, only the hit is counted
+                    values["cache_hits"] += 1
+                    continue
+                values["input_tokens"] += usage["input_tokens"]
+                values["output_tokens"] += usage["output_tokens"]
+                values["cached_tokens"] += cached
+                values["cost"] += (
+                    llm_cost(model, usage["input_tokens"], cached, usage["output_tokens"]) or 0.0
+                )
+        self._end(run_id, **values)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, "tools", name, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, bytes=_output_bytes(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def run_summary(self, thread_id):
+        """Metrics of the run `thread_id`, as plain dicts, also shortly after it finished."""
+        thread_id = str(thread_id)
+        with self._lock:
+            if thread_id in self._finished:
+                return self._finished[thread_id]
+            run = self._runs.get(thread_id)
+            return _as_dict(run) if run else None
+
+    def finish_run(self, thread_id):
+        """Writes the summary JSON of a finished run to `metrics_dir`, and the Prometheus text.
+
+        The run's entry is then dropped, its summary stays available to
+        `run_summary` for the next `FINISHED_RUNS` finished runs."""
+        with self._lock:
+            run = self._runs.pop(thread_id, None)
+            if run is None:
+                return
+            run["wall_time"] = time.time() - run["started"]
+            summary = _as_dict(run)
+            self._finished[thread_id] = summary
+            self._finished.move_to_end(thread_id)
+            while len(self._finished) > FINISHED_RUNS:
+                self._finished.popitem(last=False)
+            summary = {"thread_id": thread_id, **summary}
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            path = os.path.join(self.metrics_dir, f"{thread_id.replace('/', '+')}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+        if METRICS_PROMETHEUS_PATH:
+            write_prometheus(METRICS_PROMETHEUS_PATH)
+
+    def discard(self, thread_id):
+        """Forget the metrics of a run, its totals stay in the process metrics."""
+        with self._lock:
+            self._runs.pop(str(thread_id), None)
+            self._finished.pop(str(thread_id), None)
+
+    def totals(self):
+        with self._lock:
+            return _as_dict(self._totals)
+
+
+def _as_dict(run):
+    return {
+        key: {name: dict(entry) for name, entry in value.items()} if isinstance(value, dict) else value
+        for key, value in run.items()
+        if key != "started"
+    }
+
+
+class OtelSpans:
+    """Reports callback events as OpenTelemetry spans to an OTLP (gRPC) collector."""
+
+    def __init__(self, endpoint):
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": "codexray"}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        # sends the spans still queued
+        atexit.register(provider.shutdown)
+        self.provider = provider
+        self.tracer = provider.get_tracer(__name__)
+        self._trace = trace
+        self._lock = threading.Lock()
+        self._spans = {}  # run_id -> span
+        self._parents = {}  # run_id -> parent_run_id of the chains, spans or not
+
+    def link(self, run_id, parent_run_id):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+
+    def unlink(self, run_id):
+        with self._lock:
+            self._parents.pop(run_id, None)
+
+    def start(self, run_id, parent_run_id, name, attributes):
+        with self._lock:
+            # the closest ancestor with a span, most chains (prompts, parsers) have none
+            while parent_run_id is not None and parent_run_id not in self._spans:
+                parent_run_id = self._parents.get(parent_run_id)
+            parent = self._spans.get(parent_run_id)
+        context = self._trace.set_span_in_context(parent) if parent else None
+        span = self.tracer.start_span(name, context=context, attributes=attributes)
+        with self._lock:
+            self._spans[run_id] = span
+
+    def end(self, run_id, attributes, error=None):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        span.set_attributes(attributes)
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(error)))
+        span.end()
+
+
+@functools.cache
+def install_metrics():
+    """Adds the process' `RunMetrics` to the callbacks of every run, if `METRICS_ENABLED`.
+
+    The handler is the default of the hook's context variable, so runs started
+    from any thread or context see it.
+
+    Returns:
+        metrics (RunMetrics | None): The installed handler"""
+    if not METRICS_ENABLED:
+        return None
+    spans = OtelSpans(METRICS_OTLP_ENDPOINT) if METRICS_OTLP_ENDPOINT else None
+    metrics = RunMetrics(metrics_dir=METRICS_DIR, spans=spans)
+    register_configure_hook(ContextVar("agent_run_metrics", default=metrics), inheritable=True)
+    return metrics
+
+
+def prometheus_text(metrics=None):
+    """The process metrics in the Prometheus text exposition format."""
+    metrics = metrics or install_metrics()
+    totals = metrics.totals() if metrics else _as_dict(_new_run())
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        """Appends a metric family, `samples` are (name suffix, labels, value)."""
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}" if labels else f"{name}{suffix} {value}")
+
+    for kind, label, help_text in (
+        ("nodes", "node", "graph nodes"),
+        ("steps", "agent", "ReAct steps of the agents"),
+        ("llm", "agent", "LLM calls of the agents"),
+        ("tools", "tool", "tool calls"),
+    ):
+        entries = totals[kind].items()
+        family(
+            f"agent_{kind}_seconds",
+            "summary",
+            f"Wall time of the {help_text}",
+            [("_sum", {label: name}, round(e["seconds"], 6)) for name, e in entries]
+            + [("_count", {label: name}, e["calls"]) for name, e in entries],
+        )
+        family(
+            f"agent_{kind}_errors_total",
+            "counter",
+            f"Failed {help_text}",
+            [("", {label: name}, e["errors"]) for name, e in entries],
+        )
+    llm = totals["llm"].items()
+    family(
+        "agent_llm_tokens_total",
+        "counter",
+        "LLM tokens of the agents by type",
+        [
+            ("", {"agent": name, "type": token_type}, e[f"{token_type}_tokens"])
+            for name, e in llm
+            for token_type in ("input", "output", "cached")
+        ],
+    )
+    family(
+        "agent_llm_cache_hits_total",
+        "counter",
+        "LLM calls answered from the LLM response cache",
+        [("", {"agent": name}, e["cache_hits"]) for name, e in llm],
+    )
+    family(
+        "agent_llm_cost_total",
+        "counter",
+        "Cost of the LLM calls from LLM_PRICES",
+        [("", {"agent": name}, round(e["cost"], 6)) for name, e in llm],
+    )
+    family(
+        "agent_tools_bytes_total",
+        "counter",
+        "Bytes returned by the tool calls",
+        [("", {"tool": name}, e["bytes"]) for name, e in totals["tools"].items()],
+    )
+    # process wide, kept by the GitHub rate limiter
+    from agent.github_utils import github_request_metrics
+
+    github = github_request_metrics()
+    family(
+        "agent_github_requests_total",
+        "counter",
+        "GitHub API requests sent, retries included",
+        [("", {}, github["requests"])],
+    )
+    family(
+        "agent_github_retries_total",
+        "counter",
+        "GitHub API requests retried after a rate limit, server or connection error",
+        [("", {}, github["retries"])],
+    )
+    family(
+        "agent_github_connection_errors_total",
+        "counter",
+        "GitHub API requests failed with a connection error or timeout",
+        [("", {}, github["connection_errors"])],
+    )
+    family(
+        "agent_github_wait_seconds",
+        "summary",
+        "Time GitHub API requests waited for the rate limiter",
+        [("_sum", {}, round(github["wait_time"], 6)), ("_count", {}, github["waits"])],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes `prometheus_text` to `path` atomically, for a textfile collector."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
@@ -9,6 +9,7 @@ from .problem_solver import (
     ISSUE_RESOLVE_PROBLEM_SOLVER_SYSTEM_PROMPT,
 )
 from .reviewer import (
+    ISSUE_RESOLVE_CANDIDATE_REVIEW_PROMPT,
     ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT,
 )
 from .solution_mapper import (
@@ -19,6 +20,7 @@ from .supervisor import (
 )
 
 __all__ = [
+    "ISSUE_RESOLVE_CANDIDATE_REVIEW_PROMPT",
     "ISSUE_RESOLVE_PROBLEM_DECODER_SYSTEM_PROMPT",
     "ISSUE_RESOLVE_PROBLEM_SOLVER_SYSTEM_PROMPT",
     "ISSUE_RESOLVE_REVIEWER_SYSTEM_PROMPT",
@@ -8,3 +8,9 @@ You can assume that the patch are already applied to the codebase. You should fi
 
 If the evaluation tests passed, the generated patch fixes the issue and you should response with the "FIXED". Otherwise, you should analyze the reason and provide feedback to the supervisor and prompt the supervisor to rerun the problem_solver with the feedback.
 """
+
+ISSUE_RESOLVE_CANDIDATE_REVIEW_PROMPT = """
+You are a reviewer comparing candidate patches for the same issue. Above is the review of one candidate patch.
+
+Score how likely the candidate patch resolves the issue without breaking other behaviour, from 0 (wrong or breaks the project) to 10 (verified fix, e.g. the tests written for the issue passed), and give the reason in one sentence.
+"""
@@ -0,0 +1,135 @@
+"""
+Provider-side prompt caching of the stable prompt prefixes of the agents.
+
+Every ReAct step and routing call resends the agent's system prompt, its tool
+schemas, the issue description and the shared message history. Providers can
+skip the work for a prefix they have seen before:
+- Anthropic caches up to explicit `cache_control` breakpoints. `prompt_messages`
+  marks the system prompt (which also covers the tool schemas, sent before it)
+  and the issue description, and `bind_agent_tools` marks the newest message of
+  every ReAct step, so each step reads the prefix written by the previous one.
+- OpenAI caches prefixes automatically. Prompts keep the static parts first and
+  the history append-only, and `bind_agent_tools` sends a `prompt_cache_key`
+  per agent so the calls of one agent are routed to the same cache.
+
+`PromptCacheUsage` accounts the cached input tokens of every call.
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent.context_window import compact_messages, context_budget
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def llm_provider():
+    return os.getenv("LLM_PROVIDER", "").lower()
+
+
+def with_cache_breakpoint(message):
+    """Copy of `message` whose last content block is marked as an Anthropic cache breakpoint."""
+    content = message.content
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = [
+            {"type": "text", "text": block} if isinstance(block, str) else dict(block)
+            for block in content
+        ]
+    if not blocks or (blocks[-1].get("type") == "text" and not blocks[-1].get("text")):
+        # empty text blocks are rejected, and can't be cached anyway
+        return message
+    blocks[-1]["cache_control"] = CACHE_CONTROL
+    return message.model_copy(update={"content": blocks})
+
+
+def prompt_messages(system_prompt, messages, provider=None):
+    """The messages of an LLM call: the system prompt, then the history in order.
+
+    For Anthropic, the system prompt and the issue description (the first human
+    message) are marked as cache breakpoints."""
+    system_message = SystemMessage(content=system_prompt)
+    messages = list(messages)
+    if "anthropic" not in (provider or llm_provider()):
+        return [system_message] + messages
+
+    for index, message in enumerate(messages):
+        if isinstance(message, HumanMessage):
+            messages[index] = with_cache_breakpoint(message)
+            break
+    return [with_cache_breakpoint(system_message)] + messages
+
+
+def cached_state_modifier(system_prompt, agent_name=None):
+    """`state_modifier` of `create_react_agent` prepending a cacheable `system_prompt`
+    to the history, compacted to the context budget of `agent_name`."""
+
+    def state_modifier(state):
+        messages = compact_messages(state["messages"], context_budget(agent_name))
+        return prompt_messages(system_prompt, messages)
+
+    return state_modifier
+
+
+def bind_agent_tools(llm, tools, agent_name, provider=None):
+    """Binds `tools` to `llm` for the ReAct agent `agent_name`, with the provider's cache hints."""
+    provider = provider or llm_provider()
+    if "anthropic" in provider:
+        # moves a breakpoint to the newest message on every step
+        return llm.bind_tools(tools, cache_control=CACHE_CONTROL)
+    if "openai" in provider:
+        return llm.bind_tools(tools, prompt_cache_key=f"codexray-{agent_name}")
+    return llm
+
+
+class PromptCacheUsage(BaseCallbackHandler):
+    """Callback accounting input tokens read from and written to the provider's prompt cache, per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = defaultdict(
+            lambda: {"calls": 0, "input_tokens": 0, "cache_read": 0, "cache_creation": 0}
+        )
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                metadata = message.response_metadata or {}
+                model = metadata.get("model_name") or metadata.get("model") or "default"
+                cache_read = details.get("cache_read") or 0
+                cache_creation = details.get("cache_creation") or 0
+                logger.debug(
+                    f"{model}: {usage['input_tokens']} input tokens, {cache_read} read from and {cache_creation} written to the prompt cache"
+                )
+                with self._lock:
+                    totals = self._usage[model]
+                    totals["calls"] += 1
+                    totals["input_tokens"] += usage["input_tokens"]
+                    totals["cache_read"] += cache_read
+                    totals["cache_creation"] += cache_creation
+
+    def metrics(self):
+        """Calls, input tokens, cached tokens and the cached share of input tokens per model."""
+        with self._lock:
+            usage = {model: dict(totals) for model, totals in self._usage.items()}
+        for totals in usage.values():
+            totals["cached_share"] = (
+                totals["cache_read"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+            )
+        return usage
+
+
+prompt_cache_usage = PromptCacheUsage()
@@ -0,0 +1,194 @@
+"""
+Rate-limit-aware request scheduler shared across threads.
+
+`RateLimiter` is a token bucket that paces outgoing requests and adapts to
+the `X-RateLimit-Remaining`/`X-RateLimit-Reset` and `Retry-After` headers
+reported by the server. Rate limited responses (403/429), transient server
+errors and connection errors or timeouts are retried with exponential backoff,
+and the time spent waiting is recorded so pacing overhead can be monitored
+(reported by the batch driver and in the Prometheus metrics).
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+class RateLimiter:
+    """
+    Token bucket pacing requests across threads.
+
+    Args:
+        rate (float): Maximum sustained requests per second
+        capacity (int): Maximum burst size
+        max_retries (int): Retries of rate limited or failed requests
+        backoff_base (float): First backoff delay in seconds, doubled per retry
+        max_backoff (float): Upper bound of a single backoff delay in seconds
+    """
+
+    def __init__(
+        self, rate=5.0, capacity=10, max_retries=5, backoff_base=1.0, max_backoff=60.0
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        self._tokens = float(capacity)
+        self._current_rate = rate
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0  # monotonic time before which nothing is sent
+
+        # latest values reported by the server
+        self.remaining = None
+        self.reset = None  # epoch seconds
+
+        self._metrics = {
+            "requests": 0,
+            "retries": 0,
+            "connection_errors": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "max_wait": 0.0,
+        }
+
+    def metrics(self):
+        """Snapshot of the request, retry and waiting time counters."""
+        with self._cond:
+            return dict(self._metrics)
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self._current_rate
+        )
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    self._cond.wait(self._blocked_until - now)
+                    continue
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                self._cond.wait((1 - self._tokens) / self._current_rate)
+
+            waited = time.monotonic() - start
+            self._metrics["requests"] += 1
+            if waited > 0.001:
+                self._metrics["waits"] += 1
+                self._metrics["wait_time"] += waited
+                self._metrics["max_wait"] = max(self._metrics["max_wait"], waited)
+
+    def block_for(self, delay):
+        """Hold back all requests for `delay` seconds."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def update(self, response):
+        """Adapt the pacing to the rate limit headers of a response."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        retry_after = response.headers.get("Retry-After")
+
+        with self._cond:
+            if remaining is not None:
+                self.remaining = int(remaining)
+                self.reset = float(reset) if reset else None
+            if retry_after is not None:
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + float(retry_after)
+                )
+            elif self.remaining is not None and self.reset is not None:
+                window = max(self.reset - time.time(), 1.0)
+                if self.remaining == 0:
+                    self._blocked_until = max(
+                        self._blocked_until, time.monotonic() + window
+                    )
+                else:
+                    # spread the remaining budget over the rest of the window
+                    self._current_rate = max(
+                        min(self.rate, self.remaining / window), 1.0 / window
+                    )
+            self._cond.notify_all()
+
+    def wait_for_reserve(self, min_remaining):
+        """Block until the window resets if fewer than `min_remaining` calls are left."""
+        with self._cond:
+            remaining, reset = self.remaining, self.reset
+        if remaining is None or remaining >= min_remaining or reset is None:
+            return
+        delay = reset - time.time()
+        if delay > 0:
+            logger.warning(
+                f"Rate limit nearly exhausted ({remaining} left), waiting {delay:.0f}s"
+            )
+            start = time.monotonic()
+            time.sleep(delay)
+            with self._cond:
+                self._metrics["waits"] += 1
+                self._metrics["wait_time"] += time.monotonic() - start
+
+    def _is_rate_limited(self, response):
+        if response.status_code == 429:
+            return True
+        if response.status_code != 403:
+            return False
+        return (
+            response.headers.get("X-RateLimit-Remaining") == "0"
+            or "Retry-After" in response.headers
+            or "rate limit" in response.text.lower()
+        )
+
+    def request(self, send):
+        """Call `send()` paced by the bucket, retrying rate limited and failed requests.
+
+        Args:
+            send (Callable[[], requests.Response]): Performs the request
+        Returns:
+            response (requests.Response): The last response received.
+        Raises:
+            requests.ConnectionError, requests.Timeout: When the last retry fails to connect"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                response = send()
+            except RETRY_EXCEPTIONS as e:
+                with self._cond:
+                    self._metrics["connection_errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+                failure = f"failed with {type(e).__name__}"
+            else:
+                self.update(response)
+                retry = self._is_rate_limited(response) or (
+                    response.status_code in RETRY_STATUS_CODES
+                )
+                if not retry or attempt == self.max_retries:
+                    return response
+                failure = f"got {response.status_code}"
+
+            delay = min(self.max_backoff, self.backoff_base * 2**attempt)
+            delay += random.uniform(0, delay / 2)
+            logger.warning(
+                f"Request {failure}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})"
+            )
+            with self._cond:
+                self._metrics["retries"] += 1
+            self.block_for(delay)
@@ -0,0 +1,306 @@
+"""
+Local git mirror cache used to materialize project working copies.
+
+Each project is downloaded at most once into a bare mirror under `MIRROR_DIR`
+(optionally as a blobless partial clone). Working copies are then created from
+the mirror as `git worktree` checkouts, so new instances of an already-seen
+project materialize in seconds without re-downloading history.
+
+Mirrors can be seeded from a local repository or a git bundle for offline use,
+either explicitly via `seed_mirror` or by placing `owner/project.bundle`,
+`owner/project.git` or `owner/project` under the `MIRROR_SEED_DIR` directory.
+
+`WorktreePool` hands out one worktree per run so several issues on the same
+project can be processed concurrently without clobbering each other.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from glob import glob
+
+from git import Repo
+from git.exc import GitCommandError
+
+from agent.constant import (
+    GIT_PARTIAL_CLONE,
+    MAX_IDLE_WORKTREES,
+    MIRROR_DIR,
+    MIRROR_SEED_DIR,
+    WORKTREE_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def github_url(proj_name):
+    return f"https://github.com/{proj_name}"
+
+
+def mirror_path(proj_name):
+    """Location of the bare mirror for `owner/project`."""
+    return os.path.join(MIRROR_DIR, proj_name + ".git")
+
+
+def find_seed(proj_name):
+    """Look up an offline seed for `proj_name` under `MIRROR_SEED_DIR`, if any."""
+    if not MIRROR_SEED_DIR:
+        return None
+    base = os.path.join(MIRROR_SEED_DIR, proj_name)
+    for candidate in (base + ".bundle", base + ".git", base):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def seed_mirror(proj_name, source):
+    """Create the mirror of `proj_name` from a local repository path or git bundle.
+
+    Args:
+        proj_name (str): `owner/project` of the mirrored repository
+        source (str): Path to a local repository or a `.bundle` file
+    Returns:
+        repo (Repo): The bare mirror repository."""
+    path = mirror_path(proj_name)
+    if os.path.exists(path):
+        return Repo(path)
+
+    print(f"Seeding mirror of {proj_name} from\n\t{source}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    repo = Repo.clone_from(source, path, mirror=True)
+    # later fetches of missing commits go to GitHub rather than the seed
+    repo.git.remote("set-url", "origin", github_url(proj_name))
+    return repo
+
+
+def ensure_mirror(proj_name):
+    """Return the mirror of `proj_name`, creating it from a seed or GitHub if needed."""
+    path = mirror_path(proj_name)
+    if os.path.exists(path):
+        return Repo(path)
+
+    seed = find_seed(proj_name)
+    if seed:
+        return seed_mirror(proj_name, seed)
+
+    print(f"Mirroring {proj_name} to\n\t{path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    multi_options = ["--filter=blob:none"] if GIT_PARTIAL_CLONE else None
+    return Repo.clone_from(
+        github_url(proj_name), path, mirror=True, multi_options=multi_options
+    )
+
+
+@contextmanager
+def mirror_lock(proj_name):
+    """Serialize mirror creation and worktree bookkeeping of a project across threads and processes."""
+    path = mirror_path(proj_name) + ".lock"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def has_commit(repo, commit):
+    try:
+        repo.git.cat_file("-e", f"{commit}^{{commit}}")
+        return True
+    except GitCommandError:
+        return False
+
+
+def ensure_commit(repo, commit):
+    """Make sure `commit` is present in `repo`, fetching it from origin if missing.
+
+    Returns:
+        bool: Whether the commit is available locally."""
+    if has_commit(repo, commit):
+        return True
+    try:
+        repo.git.fetch("origin", "--prune")
+        if has_commit(repo, commit):
+            return True
+        # commits not reachable from any ref (e.g. PR heads) can be fetched by SHA
+        repo.git.fetch("origin", commit)
+    except GitCommandError as e:
+        logger.warning(f"Unable to fetch {commit} from origin: {e}")
+    return has_commit(repo, commit)
+
+
+def add_worktree(proj_name, path, commit=None):
+    """Materialize a detached worktree of `proj_name` at `path` from its mirror.
+
+    Args:
+        proj_name (str): `owner/project` of the repository
+        path (str): Directory of the new working copy, must not exist yet
+        commit (str, optional): Commit to check out, defaults to the mirror HEAD
+    Returns:
+        repo (Repo): The working copy."""
+    with mirror_lock(proj_name):
+        mirror = ensure_mirror(proj_name)
+        if commit and not ensure_commit(mirror, commit):
+            print(
+                f"[E] Unable to locate {commit} for {proj_name}\n\tUsing default commit"
+            )
+            commit = None
+
+        # drop bookkeeping of worktrees whose directories were removed
+        mirror.git.worktree("prune")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mirror.git.worktree("add", "--detach", "--force", path, commit or "HEAD")
+    return Repo(path)
+
+
+def commit_distance(repo, commit_a, commit_b):
+    """Number of commits on either side of `commit_a...commit_b`, or None if unknown."""
+    if commit_a == commit_b:
+        return 0
+    try:
+        left, right = repo.git.rev_list(
+            "--count", "--left-right", f"{commit_a}...{commit_b}"
+        ).split()
+        return int(left) + int(right)
+    except (GitCommandError, ValueError):
+        return None
+
+
+class WorktreePool:
+    """
+    Allocates one worktree per run, keyed by the LangGraph `thread_id`.
+
+    Slots live at `WORKTREE_DIR/<slot>/owner/project`, so the last path
+    components match the classic `RUNTIME_DIR/owner/project` layout. A slot is
+    leased by holding an exclusive `flock` on its `.lock` file, which keeps
+    leases exclusive across processes sharing the same `WORKTREE_DIR`.
+    Released slots stay on disk and are handed to later runs of the same
+    project, preferring the idle worktree whose HEAD is closest to the
+    requested commit so the checkout touches as few files as possible.
+    """
+
+    def __init__(self, root=WORKTREE_DIR, max_idle_per_project=MAX_IDLE_WORKTREES):
+        self.root = root
+        self.max_idle_per_project = max_idle_per_project
+        self._lock = threading.Lock()
+        self._leases = {}  # run_id -> (proj_name, path, lock file handle)
+
+    def lease(self, run_id):
+        """Return the worktree path leased to `run_id`, if any."""
+        lease = self._leases.get(str(run_id))
+        return lease[1] if lease else None
+
+    def _slots(self, proj_name):
+        return sorted(
+            lock_file[: -len(".lock")]
+            for lock_file in glob(os.path.join(self.root, "*", proj_name + ".lock"))
+        )
+
+    def _try_lock(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path + ".lock", "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+    def _rank_idle(self, proj_name, commit):
+        """Existing slots of `proj_name`, nearest to `commit` first."""
+        slots = self._slots(proj_name)
+        if not commit or len(slots) < 2:
+            return slots
+        try:
+            mirror = Repo(mirror_path(proj_name))
+        except Exception:
+            # mirror missing or still being created
+            return slots
+
+        def distance(path):
+            try:
+                head = Repo(path).head.commit.hexsha
+            except Exception:
+                return float("inf")
+            d = commit_distance(mirror, head, commit)
+            return float("inf") if d is None else d
+
+        return sorted(slots, key=distance)
+
+    def acquire(self, run_id, proj_name, commit=None):
+        """Lease a worktree path for `run_id`.
+
+        The returned directory either is an idle worktree of `proj_name` or
+        does not exist yet; `RuntimeConfig.runtime_setup` takes care of
+        materializing and resetting it at the requested commit.
+
+        Args:
+            run_id (str): Identifier of the run, usually the LangGraph thread_id
+            proj_name (str): `owner/project` of the repository
+            commit (str, optional): Commit the run will check out
+        Returns:
+            path (str): The leased worktree path."""
+        run_id = str(run_id)
+        with self._lock:
+            lease = self._leases.get(run_id)
+            if lease and lease[0] == proj_name:
+                return lease[1]
+        if lease:
+            self.release(run_id)
+
+        for path in self._rank_idle(proj_name, commit):
+            handle = self._try_lock(path)
+            if handle:
+                break
+        else:
+            slot = 0
+            while True:
+                path = os.path.join(self.root, str(slot), proj_name)
+                if not os.path.exists(path + ".lock"):
+                    handle = self._try_lock(path)
+                    if handle:
+                        break
+                slot += 1
+
+        with self._lock:
+            self._leases[run_id] = (proj_name, path, handle)
+        logger.info(f"Leased worktree {path} to run {run_id}")
+        return path
+
+    def release(self, run_id):
+        """Return the worktree leased to `run_id` to the idle pool."""
+        with self._lock:
+            lease = self._leases.pop(str(run_id), None)
+        if lease is None:
+            return
+        proj_name, path, handle = lease
+
+        idle = 0
+        for slot in self._slots(proj_name):
+            if slot == path:
+                continue
+            probe = self._try_lock(slot)
+            if probe:
+                idle += 1
+                probe.close()
+
+        if idle >= self.max_idle_per_project:
+            logger.info(f"Removing surplus worktree {path}")
+            if os.path.exists(mirror_path(proj_name)):
+                with mirror_lock(proj_name):
+                    try:
+                        Repo(mirror_path(proj_name)).git.worktree(
+                            "remove", "--force", path
+                        )
+                    except GitCommandError:
+                        pass
+            shutil.rmtree(path, ignore_errors=True)
+            os.remove(path + ".lock")
+        handle.close()
+
+
+WORKTREE_POOL = WorktreePool()
@@ -0,0 +1,204 @@
+"""
+Routing decisions of the supervisor and the multi-agent manager (MAM).
+
+`route` picks the next agent according to `ROUTING_POLICY`:
+1. Rules (`supervisor_rule`, `mam_rule`) take the obvious transitions, e.g. the
+   first step of a run or reviewing once the issue resolver produced a patch.
+2. Earlier LLM decisions are reused from a persistent cache keyed on a
+   normalized digest of the state (`routing_key`): the last agent, the running
+   summary, the trajectory of agents and tool outcomes and the last agent's
+   answer, ignoring message ids, tool call ids and whitespace.
+3. Only the remaining, ambiguous, states are sent to the LLM.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import Counter
+
+from diskcache import Cache
+
+from agent.constant import ROUTING_CACHE_DIR, ROUTING_CACHE_TTL, ROUTING_POLICY
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the message holding the patch after each problem_solver run
+LATEST_PATCH_PREFIX = "Below is the latest code changes:\n"
+
+_IDS = re.compile(
+    r"\b(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|(?:call|toolu|run)_[A-Za-z0-9]+)\b"
+)
+
+_decisions = Counter()
+_decisions_lock = threading.Lock()
+
+
+def routing_metrics():
+    """Number of routing decisions taken by rule, from the cache and by the LLM."""
+    with _decisions_lock:
+        return dict(_decisions)
+
+
+def _count(source):
+    with _decisions_lock:
+        _decisions[source] += 1
+
+
+def normalize_text(text):
+    """Text with ids removed and whitespace collapsed, so equal content digests equally."""
+    if not isinstance(text, str):
+        text = json.dumps(text, sort_keys=True, default=str)
+    return " ".join(_IDS.sub("<id>", text).split())
+
+
+def _agent_messages(messages, name):
+    return [m for m in messages if getattr(m, "name", None) == name]
+
+
+def latest_patch(messages):
+    """The patch of the most recent problem_solver run, None if it didn't run."""
+    for message in reversed(messages):
+        content = getattr(message, "content", None)
+        if isinstance(content, str) and content.startswith(LATEST_PATCH_PREFIX):
+            return content[len(LATEST_PATCH_PREFIX) :].strip()
+    return None
+
+
+def _final_answer(messages, name):
+    """Content of the last message of agent `name` that is not a tool call."""
+    for message in reversed(_agent_messages(messages, name)):
+        if not getattr(message, "tool_calls", None) and message.content:
+            return message.content
+    return None
+
+
+def routing_key(router, state):
+    """Normalized digest of the parts of `state` that routing depends on."""
+    messages = state["messages"]
+    trajectory = []
+    for message in messages:
+        if message.type == "tool":
+            trajectory.append(["tool", message.name, getattr(message, "status", None)])
+        elif message.type == "ai":
+            tools = [call["name"] for call in getattr(message, "tool_calls", None) or []]
+            trajectory.append(["ai", message.name, tools])
+        else:
+            trajectory.append([message.type, message.name])
+
+    last_agent = state.get("last_agent")
+    issue = next((m.content for m in messages if m.type == "human"), "")
+    payload = {
+        "router": router,
+        "issue": normalize_text(issue),
+        "last_agent": last_agent,
+        "summary": normalize_text(state.get("summary") or ""),
+        "trajectory": trajectory,
+        "last_answer": normalize_text(
+            (messages[-1].content if messages else "") or ""
+        ),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def supervisor_rule(state, policy=ROUTING_POLICY, nested=False):
+    """Next agent of the issue resolving supervisor when it is obvious, else None.
+
+    A patch of the problem_solver finishes the run only with the `sequential`
+    policy or when the supervisor runs `nested` in the hierarchy graph, whose
+    reviewer checks it. Otherwise the LLM decides whether to iterate on it."""
+    messages = state["messages"]
+    last_agent = state.get("last_agent")
+    if messages and messages[-1].name == "human_feedback":
+        return None
+    if last_agent == "input_handler":
+        return {
+            "next_agent": "problem_decoder",
+            "thought": "Start by decoding the issue into a problem statement.",
+        }
+    if (
+        (nested or policy == "sequential")
+        and last_agent == "problem_solver"
+        and latest_patch(messages)
+    ):
+        return {
+            "next_agent": "FINISH",
+            "thought": "The problem_solver produced a patch.",
+        }
+    if policy == "sequential":
+        following = {
+            "problem_decoder": "solution_mapper",
+            "solution_mapper": "problem_solver",
+        }
+        if last_agent in following and _final_answer(messages, last_agent):
+            return {
+                "next_agent": following[last_agent],
+                "thought": f"The {last_agent} finished, continue with the {following[last_agent]}.",
+            }
+    return None
+
+
+def mam_rule(state, policy=ROUTING_POLICY):
+    """Next agent of the multi-agent manager when it is obvious, else None."""
+    messages = state["messages"]
+    mam_messages = _agent_messages(messages, "MAM")
+    if not mam_messages:
+        return {
+            "next_agent": "issue_resolver",
+            "thought": "Start by resolving the issue.",
+        }
+    if messages[-1].name == "reviewer_node":
+        return {"next_agent": "FINISH", "thought": "The reviewer finished the review."}
+
+    last_decision = mam_messages[-1].content
+    since_decision = messages[messages.index(mam_messages[-1]) + 1 :]
+    if last_decision.endswith("Next: issue_resolver.") and latest_patch(since_decision):
+        return {
+            "next_agent": "reviewer",
+            "thought": "The issue resolver produced a patch, review it.",
+        }
+    return None
+
+
+@functools.cache
+def get_routing_cache():
+    return Cache(ROUTING_CACHE_DIR)
+
+
+def route(router, state, rule, ask_llm, policy=ROUTING_POLICY):
+    """Decide the next agent by rule, from the routing cache, or by asking the LLM.
+
+    Args:
+        router (str): Name of the router, part of the cache key
+        state (dict): The graph state
+        rule (Callable[[dict, str], dict | None]): Returns the decision for obvious states
+        ask_llm (Callable[[], dict]): Asks the LLM for the decision
+        policy (str): One of `llm`, `cache`, `rules`, `sequential`, see `ROUTING_POLICY`
+    Returns:
+        decision (dict): The `next_agent` and the `thought` behind it."""
+    if policy in ("rules", "sequential"):
+        decision = rule(state, policy)
+        if decision is not None:
+            _count("rule")
+            logger.info(f"{router} routed by rule to {decision['next_agent']}")
+            return decision
+
+    if policy == "llm":
+        _count("llm")
+        return ask_llm()
+
+    cache = get_routing_cache()
+    key = routing_key(router, state)
+    decision = cache.get(key)
+    if decision is not None:
+        _count("cache")
+        logger.info(f"{router} routed from cache to {decision['next_agent']}")
+        return decision
+
+    _count("llm")
+    decision = ask_llm()
+    cache.set(key, dict(decision), expire=ROUTING_CACHE_TTL or None)
+    return decision
@@ -0,0 +1,83 @@
+"""
+Structured logging of the agent modules, installed by `setup_logging`.
+
+Records of the `agent.*` loggers carry the id of the run they belong to (the
+LangGraph `thread_id`, see `RuntimeConfig.from_config`), so the interleaved
+output of concurrent runs can be told apart, and are written as text or as one
+JSON object per line (`LOG_FORMAT=json`) at `LOG_LEVEL`.
+
+Hot paths log with %-style arguments, so nothing is formatted for records below
+the level, and wrap large arguments (file contents, edits, patches) in
+`Payload`, which caps them to `LOG_PAYLOAD_CHARS` when the record is emitted.
+
+`setup_logging` is only called by the entry points (batch driver, `__main__`
+demos), so importing the graphs leaves the host application's logging alone.
+"""
+
+import functools
+import json
+import logging
+import sys
+
+from agent.constant import LOG_FORMAT, LOG_LEVEL, LOG_PAYLOAD_CHARS
+
+
+class Payload:
+    """Log argument rendering `value` capped to `limit` characters, only when the record is emitted."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=LOG_PAYLOAD_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if self.limit and len(text) > self.limit:
+            return f"{text[: self.limit]!r}... ({len(text)} chars)"
+        return repr(text)
+
+
+class RunIdFilter(logging.Filter):
+    """Adds the id of the current run to the records as `run_id`, `-` outside of a run."""
+
+    def filter(self, record):
+        from agent.runtime_config import current_run_id
+
+        record.run_id = current_run_id() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+@functools.cache
+def setup_logging():
+    """Configures the `agent` loggers according to `LOG_LEVEL` and `LOG_FORMAT`, once."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(RunIdFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(run_id)s] %(message)s")
+        )
+    logger = logging.getLogger("agent")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    # the root handler installed by `github_utils` would print the records again
+    logger.propagate = False
+    return logger
@@ -3,13 +3,21 @@ Handles all runtime environment configuration setup.
 Currently supports loading runtime environment using a GitHub issue URL.
 """
 
+import functools
 import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
 
 from dotenv import load_dotenv
 from git import Repo
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+from langchain_core.tracers.context import register_configure_hook
 
 from agent.constant import RUNTIME_DIR
+from agent.repo_cache import WORKTREE_POOL, add_worktree, ensure_commit
 from agent.tool_set.sepl_tools import extract_git_diff_local
 
 
@@ -38,15 +46,42 @@ def load_env_config():
     load_dotenv(env_file)
 
 
+_current_runtime: ContextVar["RuntimeConfig | None"] = ContextVar(
+    "current_runtime", default=None
+)
+
+
+def current_run_id():
+    """The id of the run of the current context, None outside of a run.
+
+    That is the runtime bound by `use_runtime`, or else the `thread_id` of the
+    graph node or tool being run."""
+    rc = _current_runtime.get()
+    if rc is not None:
+        return rc.run_id
+    config = var_child_runnable_config.get() or {}
+    thread_id = config.get("configurable", {}).get("thread_id")
+    return str(thread_id) if thread_id is not None else None
+
+
 class RuntimeConfig:
     """
-    Singleton class to hold the runtime configuration
+    Class to hold the runtime configuration of a run
+
+    `RuntimeConfig()` returns the runtime bound to the current context (see `use_runtime`),
+    falling back to a process-wide default instance. Graph nodes and tools should use
+    `RuntimeConfig.from_config(config)` instead, which keeps one instance per LangGraph
+    `thread_id` so a single process can serve many concurrent runs on different projects.
 
     Each configuration loading entry point starts with `load_from`
     """
 
     _instance = None
+    _runs: dict = {}  # thread_id -> RuntimeConfig
+    _runs_lock = threading.Lock()
+
     initialized = False
+    run_id = None
 
     preset = None
 
@@ -59,6 +94,8 @@ class RuntimeConfig:
     runtime_type: RuntimeType = None
 
     def __new__(cls, force_new_instance=False):
+        if not force_new_instance and _current_runtime.get() is not None:
+            return _current_runtime.get()
         if cls._instance is None or force_new_instance:
             instance = super().__new__(cls)
             instance.__init__()  # Initialize a new instance
@@ -67,6 +104,34 @@ class RuntimeConfig:
             return instance
         return cls._instance
 
+    @classmethod
+    def from_config(cls, config=None):
+        """Return the runtime of the run described by a `RunnableConfig`.
+
+        Runs are keyed by `config["configurable"]["thread_id"]`; configs without one
+        share the default instance. The runtime lives until `discard`, which
+        `RuntimeRelease` calls when the run's graph finishes.
+        """
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return cls()
+
+        thread_id = str(thread_id)
+        with cls._runs_lock:
+            rc = cls._runs.get(thread_id)
+            if rc is None:
+                rc = cls(force_new_instance=True)
+                rc.run_id = thread_id
+                cls._runs[thread_id] = rc
+        return rc
+
+    @classmethod
+    def discard(cls, thread_id):
+        """Forget the runtime of a finished run and return its worktree to the pool."""
+        with cls._runs_lock:
+            cls._runs.pop(str(thread_id), None)
+        WORKTREE_POOL.release(thread_id)
+
     def load(self, owner, project, commit_id):
         self.proj_name = owner + "/" + project
         self.proj_path = os.path.join(self.runtime_dir, self.proj_name)
@@ -83,26 +148,29 @@ class RuntimeConfig:
         self.runtime_type = RuntimeType.LOCAL
         self.runtime_setup()
 
-    def load_from_github_issue_url(self, issue_url):
+    def load_from_github_issue_url(self, issue_url, run_id=None):
         """Setup the runtime config based on a given issue UR;
         Args:
-            issue_url (str): The given issue URL"""
-        from agent.github_utils import (
-            get_issue_close_commit,
-            get_issue_description,
-            parse_github_issue_url,
-        )
+            issue_url (str): The given issue URL
+            run_id (str, optional): When given (usually the LangGraph thread_id), the project is
+                checked out in a worktree leased to this run instead of the shared project path.
+                Defaults to the `run_id` of runtimes created by `from_config`"""
+        from agent.github_utils import parse_github_issue_url, resolve_issue
 
         owner, project, issue = parse_github_issue_url(issue_url)
-        # TODO cache fetch results from github
 
         if not owner:
             raise ValueError(f"Invalid GitHub issue URL passed in: {issue_url}")
 
         self.proj_name = owner + "/" + project
-        self.proj_path = os.path.join(self.runtime_dir, self.proj_name)
-        self.issue_desc = get_issue_description(owner, project, issue)
-        self.commit_head = get_issue_close_commit(owner, project, issue)
+        self.issue_desc, self.commit_head = resolve_issue(owner, project, issue)
+        run_id = run_id or self.run_id
+        if run_id is None:
+            self.proj_path = os.path.join(self.runtime_dir, self.proj_name)
+        else:
+            self.proj_path = WORKTREE_POOL.acquire(
+                run_id, self.proj_name, self.commit_head
+            )
 
         checkout_parent = False
         if self.commit_head:
@@ -126,13 +194,13 @@ class RuntimeConfig:
             os.makedirs(self.runtime_dir)
 
         if not os.path.exists(self.proj_path):
-            git_url = f"https://github.com/{self.proj_name}"
-            print(f"Cloning {self.proj_name} to\n\t{self.proj_path}")
-            repo = Repo.clone_from(git_url, self.proj_path)
+            print(f"Checking out {self.proj_name} to\n\t{self.proj_path}")
+            repo = add_worktree(self.proj_name, self.proj_path, self.commit_head)
         else:
             repo = Repo(self.proj_path)
 
         if self.commit_head:
+            ensure_commit(repo, self.commit_head)
             try:
                 repo.git.checkout(self.commit_head)
             except Exception:
@@ -172,7 +240,7 @@ class RuntimeConfig:
             "runtime_type": int(self.runtime_type),
             "preset": self.preset,
             "path": self.proj_path,
-            "patch": extract_git_diff(),
+            "patch": extract_git_diff(self.proj_path),
         }
 
     def pretty_print_runtime(self):
@@ -184,6 +252,96 @@ class RuntimeConfig:
             print(f"Current Commit: {self.commit_head}")
 
 
+@contextmanager
+def use_runtime(rc):
+    """Bind `rc` as the runtime returned by `RuntimeConfig()` within the block."""
+    token = _current_runtime.set(rc)
+    try:
+        yield rc
+    finally:
+        _current_runtime.reset(token)
+
+
+class RuntimeRelease(BaseCallbackHandler):
+    """
+    Callback discarding the runtime of a run, and so returning its worktree to the
+    `WORKTREE_POOL`, when the outermost graph of the run finishes or fails.
+
+    Runs stopped by an `interrupt` keep their runtime until resumed and finished.
+    Callers managing the runtime themselves, like the batch driver reading the
+    final patch from the worktree, set `keep_runtime` in `config["configurable"]`.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roots = {}  # run_id -> run_id of the outermost graph of the run
+        self._threads = {}  # run_id of an outermost graph -> thread_id
+        self._interrupted = set()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        with self._lock:
+            if parent_run_id is None:
+                if metadata.get("thread_id") is not None and not metadata.get("keep_runtime"):
+                    self._roots[run_id] = run_id
+                    self._threads[run_id] = str(metadata["thread_id"])
+            elif parent_run_id in self._roots:
+                self._roots[run_id] = self._roots[parent_run_id]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+    def _finish(self, run_id, error=None):
+        from langgraph.errors import GraphInterrupt
+
+        with self._lock:
+            root = self._roots.pop(run_id, None)
+            if root is None:
+                return
+            if isinstance(error, GraphInterrupt):
+                self._interrupted.add(root)
+            if root != run_id:
+                return
+            thread_id = self._threads.pop(root)
+            if root in self._interrupted:
+                self._interrupted.discard(root)
+                return
+        RuntimeConfig.discard(thread_id)
+
+
+@functools.cache
+def install_runtime_release():
+    """Adds the process' `RuntimeRelease` to the callbacks of every run.
+
+    The handler is the default of the hook's context variable, so runs started
+    from any thread or context see it."""
+    release = RuntimeRelease()
+    register_configure_hook(
+        ContextVar("agent_runtime_release", default=release), inheritable=True
+    )
+    return release
+
+
+def resolve_proj_path(config=None):
+    """Resolve the project path a tool call should operate on.
+
+    An explicit `proj_path` in `config["configurable"]` takes precedence over
+    the project path of the run's runtime (see `RuntimeConfig.from_config`).
+    """
+    proj_path = (config or {}).get("configurable", {}).get("proj_path")
+    if proj_path:
+        return proj_path
+
+    rc = RuntimeConfig.from_config(config)
+    assert rc.initialized
+    return rc.proj_path
+
+
 if __name__ == "__main__":
     rc = RuntimeConfig()
     # config.load_from_dynamic_select_preset()
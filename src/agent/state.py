@@ -14,6 +14,8 @@ class CustomState(MessagesState):
     last_agent: Optional[str] = None
     next_agent: Optional[str] = None
     summary: Optional[str] = None
+    summarized_message_id: Optional[str] = None  # last message covered by `summary`
+    summarized_steps: int = 0  # number of steps covered by `summary`
     human_in_the_loop: Optional[bool] = True  # Default to True to skip HIL
     preset: Optional[str] = None
     issue_description: Optional[str] = None
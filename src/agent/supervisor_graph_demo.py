@@ -3,33 +3,51 @@ Demonstrates the supervisor based graph for fixing issue reports.
 """
 
 # %%
+import asyncio
+import functools
+import json
+import logging
 import os
 from typing import Literal
 import uuid
 
 
 import dotenv
+from langgraph.constants import NS_SEP
 from langgraph.graph import END, START, StateGraph
 from langgraph.prebuilt import create_react_agent
 from langgraph.types import Command, interrupt
 from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from typing_extensions import TypedDict
 
-from agent.llm import llm
+from agent.candidates import selection_summary, solve_with_candidates, with_temperature
+from agent.constant import PATCH_CANDIDATES, SPECULATIVE_START
+from agent.context_window import compact_messages, context_budget
+from agent.llm import get_llm
+from agent.metrics import install_metrics
+from agent.prompt_caching import (
+    bind_agent_tools,
+    cached_state_modifier,
+    prompt_messages,
+)
 from agent.prompt import (
     ISSUE_RESOLVE_PROBLEM_DECODER_SYSTEM_PROMPT,
     ISSUE_RESOLVE_PROBLEM_SOLVER_SYSTEM_PROMPT,
     ISSUE_RESOLVE_SOLUTION_MAPPER_SYSTEM_PROMPT,
     ISSUE_RESOLVE_SUPERVISOR_SYSTEM_PROMPT,
 )
-from agent.runtime_config import RuntimeConfig
+from agent.run_logging import Payload
+from agent.runtime_config import RuntimeConfig, install_runtime_release
+from agent.routing import LATEST_PATCH_PREFIX, route, supervisor_rule
 from agent.state import CustomState
-from agent.tool_set.context_tools import search_relevant_files, summarizer
+from agent.tool_node import ConcurrentToolNode
+from agent.tool_set.context_tools import (
+    search_relevant_files,
+    summarize_incrementally,
+)
 from agent.tool_set.edit_tool import str_replace_editor
-from agent.tool_set.sepl_tools import save_git_diff, view_file_content, view_directory
-from agent.utils import stage_message_processor
-
-rc = RuntimeConfig()
+from agent.tool_set.sepl_tools import asave_git_diff, view_file_content, view_directory
 
 problem_decoder_tools = [view_directory, search_relevant_files, view_file_content]
 solution_mapper_tools = [view_directory, search_relevant_files, view_file_content]
@@ -43,8 +61,17 @@ dotenv.load_dotenv(
     )
 )
 
+# per node, step and tool metrics of every run of the graph
+install_metrics()
+# the worktree of a run goes back to the pool when the run finishes
+install_runtime_release()
+logger = logging.getLogger(__name__)
+
 
 members = ["problem_decoder", "solution_mapper", "problem_solver"]
+# started in parallel by the input handler in `SPECULATIVE_START` mode
+# the initial retrieval builds the project index, the decoder's searches wait for it
+SPECULATIVE_NODES = ("initial_retrieval", "speculative_decoder")
 options = members + ["FINISH"]
 
 
@@ -55,13 +82,19 @@ class Router(TypedDict):
     thought: str
 
 
-def input_handler_node(state: CustomState) -> Command[Literal["supervisor"]]:
+def input_handler_node(
+    state: CustomState, config: RunnableConfig
+) -> Command[Literal["supervisor", *SPECULATIVE_NODES]]:
     """in issue solving, input handler will take input of
     1.swe-bench id,
-    2.issue link and setup the env accordingly"""
+    2.issue link and setup the env accordingly
+
+    With `SPECULATIVE_START`, a first retrieval on the issue and the problem_decoder
+    start in parallel right away, joined before the supervisor."""
     user_input = state["messages"][0].content
     if "/issues/" in user_input:
-        # the input are github link
+        # the input are github link, checked out in a worktree leased to this thread
+        rc = RuntimeConfig.from_config(config)
         rc.load_from_github_issue_url(user_input)
     else:
         print("error, enter a valid issue link")
@@ -75,22 +108,56 @@ def input_handler_node(state: CustomState) -> Command[Literal["supervisor"]]:
             ],
             "last_agent": "input_handler",
         },
-        goto="supervisor",
+        goto=SPECULATIVE_NODES if SPECULATIVE_START else "supervisor",
     )
 
 
+async def initial_retrieval_node(state: CustomState, config: RunnableConfig):
+    """Searches the project for files relevant to the issue description."""
+    issue_description = next(
+        message.content for message in state["messages"] if isinstance(message, HumanMessage)
+    )
+    try:
+        relevant_files = await search_relevant_files.ainvoke(
+            {"query": issue_description}, config=config
+        )
+    except Exception as e:
+        # speculative, the agents can still search themselves
+        logger.warning("Initial retrieval failed: %s", e)
+        return {}
+    return {
+        "messages": [
+            AIMessage(
+                content="Files relevant to the issue, found by similarity search on the issue description:\n"
+                + json.dumps(relevant_files, indent=2),
+                name="initial_retrieval",
+            )
+        ]
+    }
+
+
 def supervisor_node(
-    state: CustomState,
+    state: CustomState, config: RunnableConfig
 ) -> Command[
     Literal[
         "problem_decoder", "solution_mapper", "problem_solver", "human_feedback", END
     ]
 ]:
-    messages = [
-        {"role": "system", "content": ISSUE_RESOLVE_SUPERVISOR_SYSTEM_PROMPT},
-    ] + state["messages"]
+    messages = prompt_messages(
+        ISSUE_RESOLVE_SUPERVISOR_SYSTEM_PROMPT,
+        compact_messages(state["messages"], context_budget("supervisor")),
+    )
 
-    response = llm.with_structured_output(Router, strict=True).invoke(messages)
+    response = route(
+        "supervisor",
+        state,
+        functools.partial(
+            # a subgraph of the hierarchy graph, whose reviewer takes over the patch
+            supervisor_rule,
+            nested=NS_SEP in config.get("configurable", {}).get("checkpoint_ns", ""),
+        ),
+        lambda: get_llm().with_structured_output(Router, strict=True).invoke(messages),
+    )
 
     next_agent = response["next_agent"]
     goto = next_agent
@@ -104,11 +171,17 @@ def supervisor_node(
             and next_agent != last_agent
             and last_agent != "input_handler"
         ):
-            stage_messages = stage_message_processor(state["messages"])
-            summary = summarizer(stage_messages)
+            summary, summarized_message_id, summarized_steps = summarize_incrementally(
+                state["messages"],
+                state.get("summary"),
+                state.get("summarized_message_id"),
+                state.get("summarized_steps") or 0,
+            )
             return Command(
                 update={
                     "summary": summary,
+                    "summarized_message_id": summarized_message_id,
+                    "summarized_steps": summarized_steps,
                     "messages": [
                         AIMessage(
                             content="Supervisor:\nThought: "
@@ -178,15 +251,18 @@ def human_feedback_node(state: CustomState) -> Command[Literal[*members]]:
     )
 
 
-problem_decoder_agent = create_react_agent(
-    llm,
-    tools=problem_decoder_tools,
-    state_modifier=ISSUE_RESOLVE_PROBLEM_DECODER_SYSTEM_PROMPT,
-)
+@functools.cache
+def get_problem_decoder_agent():
+    # built on first run so importing the graph doesn't create the LLM
+    return create_react_agent(
+        bind_agent_tools(get_llm(), problem_decoder_tools, "problem_decoder"),
+        tools=ConcurrentToolNode(problem_decoder_tools),
+        state_modifier=cached_state_modifier(ISSUE_RESOLVE_PROBLEM_DECODER_SYSTEM_PROMPT, "problem_decoder"),
+    )
 
 
-def problem_decoder_node(state: CustomState) -> Command[Literal["supervisor"]]:
-    result = problem_decoder_agent.invoke(state)
+async def problem_decoder_node(state: CustomState) -> Command[Literal["supervisor"]]:
+    result = await get_problem_decoder_agent().ainvoke(state)
     new_messages = result["messages"][len(state["messages"]) :]
 
     for msg in new_messages:
@@ -199,16 +275,25 @@ def problem_decoder_node(state: CustomState) -> Command[Literal["supervisor"]]:
     )
 
 
-solution_mapper_agent = create_react_agent(
-    llm,
-    tools=solution_mapper_tools,
-    state_modifier=ISSUE_RESOLVE_SOLUTION_MAPPER_SYSTEM_PROMPT,
-)
+async def speculative_decoder_node(state: CustomState):
+    """problem_decoder started by `input_handler_node` in `SPECULATIVE_START` mode, joins the
+    parallel branches before the supervisor instead of routing to it."""
+    return (await problem_decoder_node(state)).update
 
 
-def solution_mapper_node(state: CustomState) -> Command[Literal["supervisor"]]:
-    print("Solution mapper node is running ~")
-    result = solution_mapper_agent.invoke(state)
+@functools.cache
+def get_solution_mapper_agent():
+    # built on first run so importing the graph doesn't create the LLM
+    return create_react_agent(
+        bind_agent_tools(get_llm(), solution_mapper_tools, "solution_mapper"),
+        tools=ConcurrentToolNode(solution_mapper_tools),
+        state_modifier=cached_state_modifier(ISSUE_RESOLVE_SOLUTION_MAPPER_SYSTEM_PROMPT, "solution_mapper"),
+    )
+
+
+async def solution_mapper_node(state: CustomState) -> Command[Literal["supervisor"]]:
+    logger.debug("Solution mapper node is running")
+    result = await get_solution_mapper_agent().ainvoke(state)
     new_messages = result["messages"][len(state["messages"]) :]
 
     for msg in new_messages:
@@ -221,25 +306,42 @@ def solution_mapper_node(state: CustomState) -> Command[Literal["supervisor"]]:
     )
 
 
-problem_solver_agent = create_react_agent(
-    llm,
-    tools=problem_solver_tools,
-    state_modifier=ISSUE_RESOLVE_PROBLEM_SOLVER_SYSTEM_PROMPT,
-)
+@functools.cache
+def get_problem_solver_agent(temperature=None):
+    # built on first run so importing the graph doesn't create the LLM
+    llm = get_llm() if temperature is None else with_temperature(get_llm(), temperature)
+    return create_react_agent(
+        bind_agent_tools(llm, problem_solver_tools, "problem_solver"),
+        tools=ConcurrentToolNode(problem_solver_tools),
+        state_modifier=cached_state_modifier(ISSUE_RESOLVE_PROBLEM_SOLVER_SYSTEM_PROMPT, "problem_solver"),
+    )
 
 
-def problem_solver_node(state: CustomState) -> Command[Literal["supervisor"]]:
-    result = problem_solver_agent.invoke(state)
-    new_messages = result["messages"][len(state["messages"]) :]
+async def problem_solver_node(
+    state: CustomState, config: RunnableConfig
+) -> Command[Literal["supervisor"]]:
+    if PATCH_CANDIDATES > 1:
+        # the candidates run on their own thread pool
+        best, candidates = await asyncio.to_thread(
+            solve_with_candidates, state, config, get_problem_solver_agent, PATCH_CANDIDATES
+        )
+        new_messages = best.messages + [
+            AIMessage(content=selection_summary(best, candidates), name="problem_solver")
+        ]
+    else:
+        result = await get_problem_solver_agent().ainvoke(state)
+        new_messages = result["messages"][len(state["messages"]) :]
 
-    # Add name to each AI message
-    for msg in new_messages:
-        if isinstance(msg, AIMessage):
-            msg.name = "problem_solver"
+        # Add name to each AI message
+        for msg in new_messages:
+            if isinstance(msg, AIMessage):
+                msg.name = "problem_solver"
 
-    latest_patch = "Below is the latest code changes:\n" + save_git_diff()
+    latest_patch = LATEST_PATCH_PREFIX + await asave_git_diff(
+        config=config
+    )
     latest_patch = latest_patch.rstrip()
-    print(f"Latest patch: {latest_patch}")
+    logger.info("Latest patch (%d chars): %s", len(latest_patch), Payload(latest_patch))
 
     return Command(
         update={
@@ -261,8 +363,16 @@ supervisor_builder.add_edge(START, "input_handler")
 supervisor_builder.add_node(
     "input_handler",
     input_handler_node,
-    destinations=({"supervisor": "input_handler-supervisor"}),
+    destinations=(
+        {
+            "supervisor": "input_handler-supervisor",
+            "initial_retrieval": "input_handler-initial_retrieval",
+            "speculative_decoder": "input_handler-speculative_decoder",
+        }
+    ),
 )
+supervisor_builder.add_node("initial_retrieval", initial_retrieval_node)
+supervisor_builder.add_node("speculative_decoder", speculative_decoder_node)
 supervisor_builder.add_node(
     "human_feedback",
     human_feedback_node,
@@ -303,7 +413,12 @@ supervisor_builder.add_node(
     ),
 )
 
+# the supervisor continues once all speculative branches are done
+supervisor_builder.add_edge(list(SPECULATIVE_NODES), "supervisor")
+
 
+# no checkpointer: embedded in the hierarchy graph it uses its parent's, and the
+# LangGraph server provides its own. The batch driver and `__main__` add one.
 issue_resolve_graph = supervisor_builder.compile()
 
 
@@ -318,7 +433,7 @@ if __name__ == "__main__":
         "recursion_limit": 100,
         "run_id": uuid.uuid4(),
         "tags": ["interrupt"],
-        "configurable": {"thread_id": "1"},
+        "configurable": {"thread_id": str(uuid.uuid4())},
     }
     initial_input = {
         "messages": [
@@ -330,8 +445,18 @@ if __name__ == "__main__":
         "human_in_the_loop": False,
     }
 
-    for chunk in issue_resolve_graph.stream(
-        initial_input, config=thread, stream_mode="values"
-    ):
-        if "messages" in chunk and len(chunk["messages"]) > 0:
-            chunk["messages"][-1].pretty_print()
+    from agent.checkpointer import get_checkpointer
+    from agent.run_logging import setup_logging
+
+    setup_logging()
+    graph = supervisor_builder.compile(checkpointer=get_checkpointer())
+
+    async def main():
+        # the agent nodes are async, so the graph runs with the async API
+        async for chunk in graph.astream(
+            initial_input, config=thread, stream_mode="values"
+        ):
+            if "messages" in chunk and len(chunk["messages"]) > 0:
+                chunk["messages"][-1].pretty_print()
+
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Tool executor of the ReAct agents, serializing the mutating tool calls of a turn.
+
+`ToolNode` runs all tool calls of a turn concurrently, so an edit could race
+with a view of the same file. Here a turn's tool calls are executed in order of
+appearance, in segments: runs of read-only calls still execute concurrently on
+the config's thread pool, limited per tool by `ConcurrentToolNode.concurrency`,
+while every other call (edits, shell commands) waits for the calls before it
+and runs alone. Results are returned in the order of the calls, so reads before
+an edit never see it and reads after it always do.
+
+The node builds on the internals of `ToolNode` (`_parse_input`, `_run_one`,
+`_arun_one`, `_combine_tool_outputs`), hence the pinned `langgraph-prebuilt`.
+"""
+
+import asyncio
+import threading
+from typing import Optional
+
+from langchain_core.runnables.config import get_config_list, get_executor_for_config
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+
+
+class ConcurrentToolNode(ToolNode):
+    """
+    `ToolNode` running read-only tool calls concurrently and serializing mutating ones.
+
+    Args:
+        tools (list): The tools of the agent
+        concurrency (dict, optional): Maximum concurrent calls per read-only tool,
+            merged over `DEFAULT_CONCURRENCY`. Tools not listed are run one at a time
+    """
+
+    # read-only tools and how many of their calls may run at once, per tool node, i.e. per agent
+    DEFAULT_CONCURRENCY = {
+        "view_directory": 4,
+        "view_file_content": 8,
+        # queries the project index and the LLM
+        "search_relevant_files": 2,
+    }
+
+    def __init__(self, tools, *, concurrency=None, **kwargs):
+        super().__init__(tools, **kwargs)
+        self.concurrency = {**self.DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self._semaphores = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in self.concurrency.items()
+        }
+
+    def is_read_only(self, call):
+        if call["name"] == "str_replace_editor":
+            return (call.get("args") or {}).get("command") == "view"
+        return call["name"] in self.concurrency
+
+    def _segments(self, tool_calls):
+        """Splits the indices of `tool_calls` into runs of read-only calls and single mutating calls."""
+        segment = []
+        for index, call in enumerate(tool_calls):
+            if self.is_read_only(call):
+                segment.append(index)
+                continue
+            if segment:
+                yield segment
+            segment = []
+            yield [index]
+        if segment:
+            yield segment
+
+    def _run_limited(self, call, input_type, config):
+        semaphore = self._semaphores.get(call["name"])
+        if semaphore is None:
+            return self._run_one(call, input_type, config)
+        with semaphore:
+            return self._run_one(call, input_type, config)
+
+    def _func(self, input, config, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        outputs = [None] * len(tool_calls)
+        with get_executor_for_config(config) as executor:
+            for segment in self._segments(tool_calls):
+                if len(segment) == 1:
+                    index = segment[0]
+                    outputs[index] = self._run_limited(tool_calls[index], input_type, config_list[index])
+                    continue
+                futures = {
+                    index: executor.submit(
+                        self._run_limited, tool_calls[index], input_type, config_list[index]
+                    )
+                    for index in segment
+                }
+                for index, future in futures.items():
+                    outputs[index] = future.result()
+        return self._combine_tool_outputs(outputs, input_type)
+
+    async def _afunc(self, input, config, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        outputs = [None] * len(tool_calls)
+        # asyncio semaphores are bound to the running loop, so limits apply per turn here
+        semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.concurrency.items()}
+
+        async def run_limited(call):
+            semaphore = semaphores.get(call["name"])
+            if semaphore is None:
+                return await self._arun_one(call, input_type, config)
+            async with semaphore:
+                return await self._arun_one(call, input_type, config)
+
+        for segment in self._segments(tool_calls):
+            results = await asyncio.gather(*(run_limited(tool_calls[index]) for index in segment))
+            for index, result in zip(segment, results):
+                outputs[index] = result
+        return self._combine_tool_outputs(outputs, input_type)
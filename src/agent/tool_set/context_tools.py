@@ -1,38 +1,80 @@
 """Defines context management tools"""
 
+import asyncio
+from collections import OrderedDict, defaultdict
+import functools
 from glob import glob
+import hashlib
+import logging
 import os
+import threading
 
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from tqdm import tqdm
 
-from agent import runtime_config
-from agent.constant import func_queries, query_java_construcor_decs, tree_sitter_parsers
-from agent.llm import llm
+from agent import constant, runtime_config
+from agent.llm import get_llm
 from agent.parsers import relevant_file_explanations_parser
 from agent.prompt import (
     RELEVANT_FILE_EXPLANATION_SYSTEM_PROMPT,
 )
+from agent.run_logging import Payload
 from agent.runtime_config import load_env_config
-from agent.utils import UndefinedValueError
+from agent.utils import UndefinedValueError, format_message_steps
 
 load_env_config()
+logger = logging.getLogger(__name__)
 
-if "OPENAI_API_KEY" not in os.environ:
-    raise UndefinedValueError("OPENAI_API_KEY")
 
-EMBEDDING_FUNCTION = OpenAIEmbeddings(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    model="text-embedding-3-small",
-)  # Defines the embedding model to use for the VectorDB with use of the `search_relevant_files` tool.
-PROJECT_KNOWLEDGE_TEXT_SPLITTER = RecursiveCharacterTextSplitter(
-    chunk_size=1000, chunk_overlap=256, separators=["\n"]
-)  # Defines the text splitter for the Vector DB with use of the `search_relevant_files` tool.
+def embedding_provider():
+    """`EMBEDDING_PROVIDER` env var, defaulting to `hash` for the offline LLM providers and `openai` otherwise."""
+    default = (
+        "hash"
+        if os.getenv("LLM_PROVIDER", "").lower() in ("fake", "replay")
+        else "openai"
+    )
+    return os.getenv("EMBEDDING_PROVIDER", default).lower()
+
+
+@functools.cache
+def get_embedding_function():
+    """Defines the embedding model to use for the VectorDB with use of the `search_relevant_files` tool."""
+    if embedding_provider() == "hash":
+        from agent.fake_models import HashedNgramEmbeddings
+
+        return HashedNgramEmbeddings()
+
+    from langchain_openai import OpenAIEmbeddings
+
+    if "OPENAI_API_KEY" not in os.environ:
+        raise UndefinedValueError("OPENAI_API_KEY")
+
+    return OpenAIEmbeddings(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        model="text-embedding-3-small",
+    )
+
+
+@functools.cache
+def get_text_splitter():
+    """Defines the text splitter for the Vector DB with use of the `search_relevant_files` tool."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=256, separators=["\n"]
+    )
+
+
+_project_knowledge_locks = defaultdict(threading.Lock)
+_project_knowledge_locks_lock = threading.Lock()
+
+
+def _project_knowledge_lock(persist_directory):
+    with _project_knowledge_locks_lock:
+        return _project_knowledge_locks[persist_directory]
 
 
 def create_project_knowledge(
@@ -47,7 +89,9 @@ def create_project_knowledge(
         project_dir: The path of the project to index.
     """
 
-    print(f"Creating project knowledge for {project_dir!r}")
+    from langchain_chroma import Chroma
+
+    logger.debug("Creating project knowledge for %r", project_dir)
     repo = (
         project_dir.split("/")[-1]
         if not project_dir.endswith("/")
@@ -56,133 +100,135 @@ def create_project_knowledge(
     rc = runtime_config.RuntimeConfig()
 
     persist_directory = os.path.join(rc.runtime_dir, collection_name + "_" + repo)
-
-    print(f"{persist_directory=}")
-    if os.path.isdir(persist_directory):
-        project_knowledge_db = Chroma(
-            persist_directory=persist_directory,
-            embedding_function=EMBEDDING_FUNCTION,
-            collection_name=collection_name,
-        )
-    else:
-        print(f"Creating project knowledge for {repo} ({project_dir})")
-        project_knowledge_db = None
-        file_paths = []
-
-        for file_type in file_types:
-            file_paths += glob(
-                os.path.join(project_dir, "**/" + file_type), recursive=True
+    if embedding_provider() != "openai":
+        # vectors of different embedding models can't share a collection
+        persist_directory += "_" + embedding_provider()
+
+    logger.debug("persist_directory=%r", persist_directory)
+    # concurrent runs and tools must not build the same index twice
+    with _project_knowledge_lock(persist_directory):
+        if os.path.isdir(persist_directory):
+            project_knowledge_db = Chroma(
+                persist_directory=persist_directory,
+                embedding_function=get_embedding_function(),
+                collection_name=collection_name,
             )
+        else:
+            logger.info("Creating project knowledge for %s (%s)", repo, project_dir)
+            project_knowledge_db = None
+            file_paths = []
 
-        total_files = len(file_paths)
-
-        file_batches = [
-            file_paths[i : i + batch_size]
-            for i in range(0, len(file_paths), batch_size)
-        ]
-        print(
-            f"Preparing to process {total_files} total files in {len(file_batches)} batches"
-        )
-
-        for file_batch_idx, file_batch in enumerate(tqdm(file_batches)):
-            file_document_batch = []
-            func_document_batch = []
-            for file_path in tqdm(file_batch):
-                with open(file_path, encoding="utf-8") as pyfile:
-                    file_content = pyfile.read()
-
-                # File processing
-                relative_file_path = file_path.replace(project_dir + "/", "")
-                file_document_batch.append(
-                    Document(
-                        page_content=file_content,
-                        metadata={"file_path": relative_file_path, "type": "file"},
-                    )
+            for file_type in file_types:
+                file_paths += glob(
+                    os.path.join(project_dir, "**/" + file_type), recursive=True
                 )
 
-                # Func processing
-                file_type_ext = relative_file_path.split(".")[-1]
-                parser = tree_sitter_parsers[file_type_ext]
-                tree = parser.parse(file_content.encode())
+            total_files = len(file_paths)
 
-                func_defs = (
-                    func_queries[file_type_ext].captures(tree.root_node).get("defs", [])
-                )
-                if (
-                    file_type_ext == "java"
-                ):  # Java contains a "constructor_declaration" node separate from the already queried "method_declarations" nodes
-                    constructor_defs = query_java_construcor_decs.captures(
-                        tree.root_node
-                    ).get("defs", [])
-                    func_defs = constructor_defs + func_defs
-                for func_def in func_defs:
-                    func_content = func_def.text.decode()
-                    func_name = func_def.child_by_field_name("name").text.decode()
-                    func_document_batch.append(
+            file_batches = [
+                file_paths[i : i + batch_size]
+                for i in range(0, len(file_paths), batch_size)
+            ]
+            logger.info(
+                "Preparing to process %d total files in %d batches", total_files, len(file_batches)
+            )
+
+            text_splitter = get_text_splitter()
+            for file_batch_idx, file_batch in enumerate(tqdm(file_batches)):
+                file_document_batch = []
+                func_document_batch = []
+                for file_path in tqdm(file_batch):
+                    with open(file_path, encoding="utf-8") as pyfile:
+                        file_content = pyfile.read()
+
+                    # File processing
+                    relative_file_path = file_path.replace(project_dir + "/", "")
+                    file_document_batch.append(
                         Document(
-                            page_content=func_content,
-                            metadata={
-                                "file_path": relative_file_path,
-                                "func_name": func_name,
-                                "type": "func",
-                            },
+                            page_content=file_content,
+                            metadata={"file_path": relative_file_path, "type": "file"},
                         )
                     )
 
-            # Chunk the docs
-            file_document_batch_split = PROJECT_KNOWLEDGE_TEXT_SPLITTER.split_documents(
-                file_document_batch
-            )
-            func_document_batch_split = PROJECT_KNOWLEDGE_TEXT_SPLITTER.split_documents(
-                func_document_batch
-            )
+                    # Func processing
+                    file_type_ext = relative_file_path.split(".")[-1]
+                    parser = constant.tree_sitter_parsers[file_type_ext]
+                    tree = parser.parse(file_content.encode())
 
-            print(
-                f"Inserting {len(file_document_batch_split)} file and {len(func_document_batch_split)} func chunked documents for batch {file_batch_idx}"
-            )
-            # Insert chunked docs Chroma
-            if project_knowledge_db is None:
-                project_knowledge_db = Chroma.from_documents(
-                    file_document_batch_split + func_document_batch_split,
-                    EMBEDDING_FUNCTION,
-                    collection_name=collection_name,
-                    persist_directory=persist_directory,
+                    func_defs = (
+                        constant.func_queries[file_type_ext].captures(tree.root_node).get("defs", [])
+                    )
+                    if (
+                        file_type_ext == "java"
+                    ):  # Java contains a "constructor_declaration" node separate from the already queried "method_declarations" nodes
+                        constructor_defs = constant.query_java_construcor_decs.captures(
+                            tree.root_node
+                        ).get("defs", [])
+                        func_defs = constructor_defs + func_defs
+                    for func_def in func_defs:
+                        func_content = func_def.text.decode()
+                        func_name = func_def.child_by_field_name("name").text.decode()
+                        func_document_batch.append(
+                            Document(
+                                page_content=func_content,
+                                metadata={
+                                    "file_path": relative_file_path,
+                                    "func_name": func_name,
+                                    "type": "func",
+                                },
+                            )
+                        )
+
+                # Chunk the docs
+                file_document_batch_split = text_splitter.split_documents(
+                    file_document_batch
                 )
-            else:
-                project_knowledge_db.add_documents(
-                    file_document_batch_split + func_document_batch_split
+                func_document_batch_split = text_splitter.split_documents(
+                    func_document_batch
                 )
 
-    # Retrieve docs for log
-    total_files, total_funcs = (
-        len(project_knowledge_db.get(where={"type": "file"})["ids"]),
-        len(project_knowledge_db.get(where={"type": "func"})["ids"]),
-    )
-    print(
-        f"Connected to DB {persist_directory}:{collection_name} containing {total_files} total files and {total_funcs} total func documents."
-    )
+                logger.debug(
+                    "Inserting %d file and %d func chunked documents for batch %d",
+                    len(file_document_batch_split),
+                    len(func_document_batch_split),
+                    file_batch_idx,
+                )
+                # Insert chunked docs Chroma
+                if project_knowledge_db is None:
+                    project_knowledge_db = Chroma(
+                        persist_directory=persist_directory,
+                        embedding_function=get_embedding_function(),
+                        collection_name=collection_name,
+                    )
+                documents = file_document_batch_split + func_document_batch_split
+                # a single upsert is limited to the client's max batch size
+                max_batch_size = project_knowledge_db._client.get_max_batch_size()
+                for i in range(0, len(documents), max_batch_size):
+                    project_knowledge_db.add_documents(documents[i : i + max_batch_size])
+
+    if logger.isEnabledFor(logging.DEBUG):
+        # counting the documents queries the whole collection, only done for the log
+        total_files, total_funcs = (
+            len(project_knowledge_db.get(where={"type": "file"})["ids"]),
+            len(project_knowledge_db.get(where={"type": "func"})["ids"]),
+        )
+        logger.debug(
+            "Connected to DB %s:%s containing %d total files and %d total func documents.",
+            persist_directory,
+            collection_name,
+            total_files,
+            total_funcs,
+        )
 
     # create VectorStoreRetriever
     project_knowledge_retriever = project_knowledge_db.as_retriever()
     return project_knowledge_retriever, project_knowledge_db
 
 
-@tool
-def search_relevant_files(query: str, k=10):
-    """Given a query search string (for example, the issue report description, filenames, etc), search for relevant code snippets of files in the project by calculating embedding similarity between the query and code snippets in a vector database.
-
-    Args:
-        query: A search string (for example, the issue report description, filenames, etc), to be used to find relevant files and functions.
-    """
-    rc = runtime_config.RuntimeConfig()
-
-    project_knowledge_retriever, _ = create_project_knowledge(rc.proj_path)
-
-    relevant_docs = project_knowledge_retriever.get_relevant_documents(query, k=k)
-
+def _relevant_files_prompt(query, k, relevant_docs):
+    """Builds the prompt asking the LLM to explain the relevancy of the retrieved docs."""
     full_result = []
     return_string = f"Top {k} most relevant files: \n\n"
-    print("-----RELEVANT DOCS-----")
     for doc in relevant_docs:
         return_string += doc.metadata["file_path"] + "\n"
         # if "func_name" in doc.metadata and doc.metadata["type"] == "func":
@@ -203,12 +249,28 @@ def search_relevant_files(query: str, k=10):
                 }
             )
 
-    return_string = return_string.strip()
+    logger.debug("Relevant docs for %s: %s", Payload(query), Payload(return_string.strip()))
 
-    explain_prompt = RELEVANT_FILE_EXPLANATION_SYSTEM_PROMPT.substitute(
+    return RELEVANT_FILE_EXPLANATION_SYSTEM_PROMPT.substitute(
         search_term=query, k=k, full_result=full_result
     ).strip()
-    generate_explanation = llm.invoke([HumanMessage(explain_prompt)])
+
+
+@tool
+def search_relevant_files(query: str, k=10, config: RunnableConfig = None):
+    """Given a query search string (for example, the issue report description, filenames, etc), search for relevant code snippets of files in the project by calculating embedding similarity between the query and code snippets in a vector database.
+
+    Args:
+        query: A search string (for example, the issue report description, filenames, etc), to be used to find relevant files and functions.
+    """
+    proj_path = runtime_config.resolve_proj_path(config)
+
+    project_knowledge_retriever, _ = create_project_knowledge(proj_path)
+
+    relevant_docs = project_knowledge_retriever.get_relevant_documents(query, k=k)
+
+    explain_prompt = _relevant_files_prompt(query, k, relevant_docs)
+    generate_explanation = get_llm().invoke([HumanMessage(explain_prompt)])
 
     explanations = relevant_file_explanations_parser.invoke(
         generate_explanation.content
@@ -216,16 +278,46 @@ def search_relevant_files(query: str, k=10):
     return explanations
 
 
-def summarizer(stage_msgs_processed):
-    """Summarize the information of previous chat history to gain addtiional information or remember what you were doing."""
+async def _asearch_relevant_files(query: str, k=10, config: RunnableConfig = None):
+    proj_path = runtime_config.resolve_proj_path(config)
+
+    # indexing is blocking file, parser and Chroma work
+    _, project_knowledge_db = await asyncio.to_thread(
+        create_project_knowledge, proj_path
+    )
+
+    query_embedding = await get_embedding_function().aembed_query(query)
+    relevant_docs = await asyncio.to_thread(
+        project_knowledge_db.similarity_search_by_vector, query_embedding, k=k
+    )
+
+    explain_prompt = _relevant_files_prompt(query, k, relevant_docs)
+    generate_explanation = await get_llm().ainvoke([HumanMessage(explain_prompt)])
+
+    explanations = await relevant_file_explanations_parser.ainvoke(
+        generate_explanation.content
+    )
+    return explanations
+
+
+search_relevant_files.coroutine = _asearch_relevant_files
+
+
+def summarizer(stage_msgs_processed, previous_summary=None):
+    """Summarize the information of previous chat history to gain addtiional information or remember what you were doing.
+
+    With a `previous_summary` of the earlier messages, only the new `stage_msgs_processed` are
+    summarized and appended to it."""
     stage_message_keys = list(stage_msgs_processed.keys())
     stage_messages = {}
     for k in stage_message_keys:
         stage_messages[k] = stage_msgs_processed[k]
 
     summary_prompt = f"Summarize the messages in the following conversation. Be sure to include aggregated details of the key steps and or goals of the message. Include the names of the agents and tools features in the steps. If the agent did not describe its process but used a tool mention the used tool(s). Also include any raw content such as problem statements, solution plans, generated code and or patches if applicable. Be sure to only output your result. Here are the message(s):\n```{stage_messages}\n\nHere is an example of the result:\n```\nStep 1: The user submitted the issue to be resolved.\nStep 2. The supervisor delegated the task to the problem_decoder\nStep 3. The problem_decoder asked the context_manager for help\nStep 4. The context_manager searched for relevant files in the codebase, including file1.py, file2.py.\nStep 5. The context_manager viewed the file file5.py using `view_file_content`.```"
+    if previous_summary:
+        summary_prompt = f"Here is the summary of the earlier steps of the conversation:\n```{previous_summary}```\n\nThe messages below continue the conversation, only summarize these new steps and continue the step numbering. {summary_prompt}"
 
-    response = llm.invoke(
+    response = get_llm().invoke(
         [
             HumanMessage(
                 summary_prompt.strip(),
@@ -236,4 +328,76 @@ def summarizer(stage_msgs_processed):
 
     summary = response.content
 
+    if previous_summary:
+        return f"{previous_summary}\n{summary}"
     return summary
+
+
+# summaries by (previous summary digest, first message id, last message id)
+_summary_cache = OrderedDict()
+_summary_cache_lock = threading.Lock()
+SUMMARY_CACHE_SIZE = 256
+
+
+def summarize_incrementally(messages, summary=None, summarized_message_id=None, summarized_steps=0):
+    """Updates the running `summary` of `messages` with the messages after `summarized_message_id`.
+
+    Only the new messages are sent to the summarizer, so each update costs O(new
+    messages). Results are cached per message id range.
+
+    Args:
+        messages (list): The whole message history
+        summary (str, optional): Running summary of the messages up to `summarized_message_id`
+        summarized_message_id (str, optional): Id of the last message covered by `summary`
+        summarized_steps (int): Number of steps covered by `summary`, continued by the new steps
+    Returns:
+        summary (str): The updated summary
+        summarized_message_id (str): Id of the last message it covers
+        summarized_steps (int): Number of steps it covers"""
+    start = 0
+    if summarized_message_id is not None:
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].id == summarized_message_id:
+                start = index + 1
+                break
+        else:
+            # the summarized messages were removed, start over
+            summary = None
+    if start == 0:
+        summary = None
+        summarized_steps = 0
+
+    # earlier summaries shown to the human are not part of the conversation
+    new_messages = [
+        message for message in messages[start:] if message.name != "conversation_summary"
+    ]
+    if not new_messages:
+        return summary, summarized_message_id, summarized_steps
+    last_id = messages[-1].id
+
+    key = (
+        hashlib.sha256((summary or "").encode("utf-8")).hexdigest(),
+        summarized_steps,
+        new_messages[0].id,
+        last_id,
+    )
+    with _summary_cache_lock:
+        if key in _summary_cache:
+            _summary_cache.move_to_end(key)
+            updated, steps = _summary_cache[key]
+            return updated, last_id, steps
+
+    # the issue opening the history is skipped as it's duplicated, later
+    # updates continue the step numbering of the summarized messages
+    stage_messages = format_message_steps(
+        new_messages, first_step=summarized_steps + 1, skip_first=start == 0
+    )
+    if not stage_messages:
+        return summary, last_id, summarized_steps
+    updated = summarizer(stage_messages, previous_summary=summary)
+    steps = summarized_steps + len(stage_messages)
+    with _summary_cache_lock:
+        _summary_cache[key] = (updated, steps)
+        while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return updated, last_id, steps
@@ -1,3 +1,5 @@
+import asyncio
+import logging
 from typing import Annotated, List, Optional
 
 from langchain_core.tools import tool
@@ -10,6 +12,8 @@ from agent.runtime_config import RuntimeConfig
 from agent.tool_set.sepl_tools import save_git_diff
 from agent.tool_set.oheditor import CLIResult, OHEditor
 from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
 _GLOBAL_EDITOR = OHEditor()
 
 
@@ -75,15 +79,9 @@ def str_replace_editor(
         view_range (Optional[List[int]]): Optional parameter of `view` command when `path` points to a file. If none is given, the full file is shown. If provided, the file will be shown in the indicated line number range, e.g. [100, 600] will show content between line 100 and 600. Indexing at 1 to start. Setting `[start_line, -1]` shows all lines from `start_line` to the end of the file. Unless you are sure about the line numbers, otherwise, do not set this parameter and use the `view` command to view the whole file.
 
     """
-    # try to fetch project_path from config, it might not exist
-    proj_path = config.get("configurable", {}).get("proj_path")
-    if proj_path is None:
-        rc = runtime_config.RuntimeConfig()
-        assert rc.initialized
-        proj_path = rc.proj_path
-        print(f"use global runtime config project path: {proj_path}")
-    else:
-        print(f"use configrable config project path: {proj_path}")
+    # resolve the project path of this run (config, leased worktree or global runtime)
+    proj_path = runtime_config.resolve_proj_path(config)
+    logger.debug("use project path: %s", proj_path)
     result = _GLOBAL_EDITOR(
         command=command,
         path=path,
@@ -97,6 +95,36 @@ def str_replace_editor(
     return _make_cli_result(result)
 
 
+async def _astr_replace_editor(
+    command: str,
+    path: str,
+    config: RunnableConfig,
+    file_text: Optional[str] = None,
+    old_str: Optional[str] = None,
+    new_str: Optional[str] = None,
+    insert_line: Optional[int] = None,
+    view_range: Optional[List[int]] = None,
+):
+    proj_path = runtime_config.resolve_proj_path(config)
+    logger.debug("use project path: %s", proj_path)
+    # file I/O and linting are blocking, run them in a worker thread
+    result = await asyncio.to_thread(
+        _GLOBAL_EDITOR,
+        command=command,
+        path=path,
+        file_text=file_text,
+        view_range=view_range,
+        old_str=old_str,
+        new_str=new_str,
+        insert_line=insert_line,
+        proj_path=proj_path,
+    )
+    return _make_cli_result(result)
+
+
+str_replace_editor.coroutine = _astr_replace_editor
+
+
 if __name__ == "__main__":
     rc = runtime_config.RuntimeConfig()
     rc.load_from_preset("gitpython-developers+GitPython@1413.yaml")
@@ -1,5 +1,6 @@
 # This file is is adapted from OpenHands
 # https://github.com/All-Hands-AI/openhands-aci/blob/main/openhands_aci/editor/editor.py
+import logging
 import mimetypes
 import os
 import re
@@ -14,8 +15,11 @@ from agent.tool_set.linter import DefaultLinter
 from agent.tool_set.utils import run_shell_local, maybe_truncate
 from agent.tool_set.constant import *
 from agent import runtime_config
+from agent.run_logging import Payload
 # from agent.tool_set.edit_history import FileHistoryManager
 
+logger = logging.getLogger(__name__)
+
 Command = Literal[
     "view",
     "create",
@@ -92,8 +96,16 @@ class OHEditor:
     ) -> CLIResult:
         _path = Path(os.path.join(proj_path, path))
 
-        print(
-            f"path: {_path}, command:{command}, file_text:{file_text}, view_range:{view_range}, old_str:{old_str}, new_str:{new_str}, insert_line:{insert_line}, linting:{enable_linting}"
+        logger.debug(
+            "editor %s path=%s view_range=%s insert_line=%s linting=%s file_text=%s old_str=%s new_str=%s",
+            command,
+            _path,
+            view_range,
+            insert_line,
+            enable_linting,
+            Payload(file_text),
+            Payload(old_str),
+            Payload(new_str),
         )
 
         # if file ends with .py, enable linting
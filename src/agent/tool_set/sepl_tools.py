@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import os
 from pathlib import Path
 import subprocess
@@ -12,12 +14,16 @@ from langchain_core.runnables import RunnableConfig
 from agent import runtime_config
 from agent.constant import PATCH_RESULT_DIR, RUNTIME_DIR
 
+logger = logging.getLogger(__name__)
+
 MAX_LIST_FILES = 50  # the maximum number of files to return
 MAX_RESPONSE_LEN_CHAR: int = 32000
 
 
 @tool
-def view_directory(dir_path: str = "./", depth: Optional[int] = None) -> List[str]:
+def view_directory(
+    dir_path: str = "./", depth: Optional[int] = None, config: RunnableConfig = None
+) -> List[str]:
     """View the file structure of the repository, including directories (marked with /).
     Automatically reduces depth if entries exceed 50.
 
@@ -28,8 +34,9 @@ def view_directory(dir_path: str = "./", depth: Optional[int] = None) -> List[st
     Returns:
         List[str]: Sorted list of directories (with /) and files.
     """
-    rc = runtime_config.RuntimeConfig()
+    rc = runtime_config.RuntimeConfig.from_config(config)
     assert rc.initialized
+    proj_path = runtime_config.resolve_proj_path(config)
 
     # Normalize dir_path to ensure proper filtering
     #
@@ -44,7 +51,7 @@ def view_directory(dir_path: str = "./", depth: Optional[int] = None) -> List[st
     # Fetch all files in the repository
     file_list = []
     if rc.runtime_type == runtime_config.RuntimeType.LOCAL:
-        repo = Repo(rc.proj_path)
+        repo = Repo(proj_path)
         file_list = [entry.path for entry in repo.commit().tree.traverse()]
     else:
         raise ValueError("Unsupported runtime type")
@@ -107,14 +114,14 @@ def view_directory(dir_path: str = "./", depth: Optional[int] = None) -> List[st
     for d in range(start_depth, -1, -1):
         adjusted_entries = filter_entries(d)
         if len(adjusted_entries) <= 50:
-            print(f"Note: Reduced depth to {d} with {len(adjusted_entries)} entries")
+            logger.debug("Reduced depth to %d with %d entries", d, len(adjusted_entries))
             return [
                 f"Note: Reduced depth to {d} with {len(adjusted_entries)} entries"
             ] + adjusted_entries
 
     # Fallback (depth 0)
     final_entries = filter_entries(0)
-    print(f"Note: Limited to depth 0 with {len(final_entries)} entries")
+    logger.debug("Limited to depth 0 with %d entries", len(final_entries))
     return [
         f"Note: Limited to depth 0 with {len(final_entries)} entries"
     ] + final_entries
@@ -130,6 +137,7 @@ def view_file_content(
         Optional[List[int]],
         "Optional parameter [start_line, end_line] to specify the range of lines to view",
     ] = None,
+    config: RunnableConfig = None,
 ) -> str:
     """
     Read the content of the specified file.
@@ -143,14 +151,17 @@ def view_file_content(
     Returns:
         str: Content of the file or the specified line range.
     """
-    rc = runtime_config.RuntimeConfig()
+    rc = runtime_config.RuntimeConfig.from_config(config)
     assert rc.initialized
-    print(
-        'view_file_content: path:%s file_name="%s" view_range=%s'
-        % (rc.proj_path, file_name, view_range)
+    proj_path = runtime_config.resolve_proj_path(config)
+    logger.debug(
+        'view_file_content: path:%s file_name="%s" view_range=%s',
+        proj_path,
+        file_name,
+        view_range,
     )
     if rc.runtime_type == runtime_config.RuntimeType.LOCAL:
-        full_file_path = os.path.join(rc.proj_path, file_name)
+        full_file_path = os.path.join(proj_path, file_name)
         if not os.path.isfile(full_file_path):
             raise ValueError(f"file_name: '{file_name}' doesn't exist!")
         with open(full_file_path, encoding="utf-8") as f:
@@ -190,19 +201,47 @@ def view_file_content(
     return snippet_content
 
 
-def extract_git_diff_local():
-    """Executes and returns the `git diff` command in a local runtime environment."""
-    rc = runtime_config.RuntimeConfig()
-    print("extracting git diff local")
-    rc.pretty_print_runtime()
+async def _aview_directory(
+    dir_path: str = "./", depth: Optional[int] = None, config: RunnableConfig = None
+) -> List[str]:
+    # tree traversal is blocking git object access, keep it off the event loop
+    return await asyncio.to_thread(view_directory.func, dir_path, depth, config)
+
+
+async def _aview_file_content(
+    file_name: str,
+    view_range: Optional[List[int]] = None,
+    config: RunnableConfig = None,
+) -> str:
+    return await asyncio.to_thread(
+        view_file_content.func, file_name, view_range, config
+    )
+
+
+view_directory.coroutine = _aview_directory
+view_file_content.coroutine = _aview_file_content
+
+
+def extract_git_diff_local(proj_path=None, config=None):
+    """Executes and returns the `git diff` command in a local runtime environment.
+
+    Args:
+        proj_path (str, optional): Working copy to diff, defaults to the project path of the run
+        config (RunnableConfig, optional): Config of the run, see `RuntimeConfig.from_config`
+    """
+    rc = runtime_config.RuntimeConfig.from_config(config)
     assert rc.initialized
     assert rc.runtime_type == runtime_config.RuntimeType.LOCAL
+    proj_path = proj_path or runtime_config.resolve_proj_path(config)
+    logger.debug(
+        "extracting git diff of %s at %s (commit %s)", rc.proj_name, proj_path, rc.commit_head
+    )
 
     import subprocess
 
     process = subprocess.Popen(
         "/bin/bash",
-        cwd=rc.proj_path,
+        cwd=proj_path,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         text=True,
@@ -214,12 +253,28 @@ def extract_git_diff_local():
     return out
 
 
-# %%
-def save_git_diff():
-    print("Saving git diff")
-    rc = runtime_config.RuntimeConfig()
+async def aextract_git_diff_local(proj_path=None, config=None):
+    """Async variant of `extract_git_diff_local` running `git diff` as a subprocess of the event loop."""
+    rc = runtime_config.RuntimeConfig.from_config(config)
+    assert rc.initialized
+    assert rc.runtime_type == runtime_config.RuntimeType.LOCAL
+    proj_path = proj_path or runtime_config.resolve_proj_path(config)
+
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        "-c",
+        "core.fileMode=false",
+        "diff",
+        "--exit-code",
+        "--no-color",
+        cwd=proj_path,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    out, _ = await process.communicate()
+    return out.decode("utf-8", errors="replace")
+
 
-    git_diff_output_before = extract_git_diff_local()
+def _write_patch(rc, git_diff_output):
     instance_id = rc.proj_name.replace("/", "+")
 
     patch_path = (
@@ -227,9 +282,29 @@ def save_git_diff():
         + ".patch"
     )
 
+    os.makedirs(PATCH_RESULT_DIR, exist_ok=True)
     with open(patch_path, "w", encoding="utf-8") as save_file:
-        save_file.write(git_diff_output_before)
+        save_file.write(git_diff_output)
     # print(f"Saved patch content to {patch_path}")
+
+
+# %%
+def save_git_diff(proj_path=None, config=None):
+    logger.debug("saving git diff")
+    rc = runtime_config.RuntimeConfig.from_config(config)
+
+    git_diff_output_before = extract_git_diff_local(proj_path, config)
+    _write_patch(rc, git_diff_output_before)
+    return git_diff_output_before
+
+
+async def asave_git_diff(proj_path=None, config=None):
+    """Async variant of `save_git_diff`."""
+    logger.debug("saving git diff")
+    rc = runtime_config.RuntimeConfig.from_config(config)
+
+    git_diff_output_before = await aextract_git_diff_local(proj_path, config)
+    await asyncio.to_thread(_write_patch, rc, git_diff_output_before)
     return git_diff_output_before
 
 
@@ -243,14 +318,9 @@ def run_shell_cmd(
 ) -> str:
     """Run a list of shell commands in sequential order and return the stdout results, your working directory is the root of the project"""
 
-    proj_path = config.get("configurable", {}).get("proj_path")
-    if proj_path is None:
-        rc = runtime_config.RuntimeConfig()
-        assert rc.initialized
-        proj_path = rc.proj_path
-        print(f"use global runtime config project path: {proj_path}")
-    else:
-        print(f"use configrable config project path: {proj_path}")
+    rc = runtime_config.RuntimeConfig.from_config(config)
+    proj_path = runtime_config.resolve_proj_path(config)
+    logger.debug("use project path: %s", proj_path)
 
     if rc.runtime_type == runtime_config.RuntimeType.LOCAL:
         import subprocess
@@ -270,6 +340,28 @@ def run_shell_cmd(
         raise NotImplementedError
 
 
+async def _arun_shell_cmd(commands: List[str], config: RunnableConfig) -> str:
+    rc = runtime_config.RuntimeConfig.from_config(config)
+    proj_path = runtime_config.resolve_proj_path(config)
+    logger.debug("use project path: %s", proj_path)
+
+    if rc.runtime_type == runtime_config.RuntimeType.LOCAL:
+        process = await asyncio.create_subprocess_exec(
+            "/bin/bash",
+            cwd=proj_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        out, _ = await process.communicate("\n".join(commands).encode())
+        return out.decode("utf-8", errors="replace")
+
+    else:
+        raise NotImplementedError
+
+
+run_shell_cmd.coroutine = _arun_shell_cmd
+
+
 if __name__ == "__main__":
     runtime_config = runtime_config.RuntimeConfig()
     runtime_config.load_from_github_issue_url(
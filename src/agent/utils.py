@@ -1,6 +1,8 @@
 """
 Defines various util functions for the prototype."""
 
+from collections.abc import Mapping
+
 
 class UndefinedValueError(ValueError):
     """
@@ -20,44 +22,74 @@ class UndefinedValueError(ValueError):
         super().__init__(message)
 
 
-def stage_message_processor(messages):
-    """Based on XY's `message_processor` with few additions. It is used for newest version of summarizer/summary."""
-    message_json = {}
-    step = 0
-
-    index = 0
-    found_human_feedback = False
-    messages = [
-        vars(message) if not isinstance(message, dict) else message
-        for message in messages
-    ]
-    for message in messages:
-        if message["name"] == "human_feedback":
-            found_human_feedback = True
-            index = messages.index(message)
-
-    if not found_human_feedback:
-        index = 0
-
-    messages = messages[index:]
-
-    for message in messages:
-        if message["type"] != "tool":
-            # if message['content'] is string:
-            if isinstance(message["content"], str):
-                if step == 0:
-                    step += 1
-                    continue  # skip human input as its duplicated
-                name = message["name"] if "name" in message else ""
-                message_json[f"Step {step} {name}:"] = {"detail": message["content"]}
-            else:
-                detail_cnt = 1
-                details = {}
-                for content in message["content"]:
-                    details[f"Detail {detail_cnt} {content['type']}:"] = content
-                    detail_cnt += 1
-                name = message["name"] if "name" in message else ""
-                message_json[f"Step {step} {name}:"] = {"detail": details}
+_MISSING = object()
+
+
+def _field(message, name, default=_MISSING):
+    """Field `name` of a message or of its dict."""
+    if isinstance(message, dict):
+        return message[name] if default is _MISSING else message.get(name, default)
+    if default is _MISSING:
+        return getattr(message, name)
+    return getattr(message, name, default)
+
+
+class MessageSteps(Mapping):
+    """
+    Read-only view numbering the non-tool messages of a history as steps for the summarizer.
+
+    Maps `Step <n> <name>:` to `{"detail": content}`, where list contents become
+    `{"Detail <i> <type>:": block}`. The view keeps references to the messages and
+    builds the details on access, so creating it doesn't copy any content.
+
+    Args:
+        messages (list): Messages, or their dicts
+        first_step (int): Number of the first step
+        skip_first (bool): Leave out the first message with text content, e.g. the duplicated human input
+    """
 
+    def __init__(self, messages, first_step=1, skip_first=False):
+        self._messages = messages
+        self._steps = {}  # step key -> message index
+        step = first_step - 1 if skip_first else first_step
+        for index in range(len(messages)):
+            message = messages[index]
+            if _field(message, "type") == "tool":
+                continue
+            if skip_first and step == first_step - 1 and isinstance(_field(message, "content"), str):
+                step += 1
+                continue  # skip human input as its duplicated
+            self._steps[f"Step {step} {_field(message, 'name', '')}:"] = index
             step += 1
-    return message_json
+
+    def __getitem__(self, key):
+        content = _field(self._messages[self._steps[key]], "content")
+        if isinstance(content, str):
+            return {"detail": content}
+        return {
+            "detail": {
+                f"Detail {number} {block['type']}:": block
+                for number, block in enumerate(content, 1)
+            }
+        }
+
+    def __iter__(self):
+        return iter(self._steps)
+
+    def __len__(self):
+        return len(self._steps)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def format_message_steps(messages, first_step=1, skip_first=False):
+    """Formats the non-tool messages as numbered steps for the summarizer.
+
+    Args:
+        messages (list): Messages, or their dicts
+        first_step (int): Number of the first step
+        skip_first (bool): Leave out the first message, e.g. the duplicated human input
+    Returns:
+        steps (MessageSteps): Lazy view of the steps, see `MessageSteps`"""
+    return MessageSteps(messages, first_step=first_step, skip_first=skip_first)